@@ -1,12 +1,30 @@
 from abc import ABC, abstractmethod
 
 class BaseAudioSink(ABC):
-
+    # seconds a chunk may wait for room in the sink before it is dropped (None: no limit)
+    block_timeout = None
 
     @abstractmethod
     def write(self, session, chunk):
+        """
+        Plays or sends `chunk` (bytes-like, e.g. a memoryview of a cached file). The chunk is only
+        valid during the call; a sink which keeps it afterwards has to copy it.
+        """
         pass
 
+    def offer(self, session, chunk, wake):
+        """
+        Non-blocking `write` for the playback pool. Returns False if the sink has no room for
+        `chunk` right now and calls `wake()` once it may have. Sinks which cannot tell (e.g. a
+        sound card) simply block in `write`.
+        """
+        self.write(session, chunk)
+        return True
+
     @abstractmethod
     def close(self, session):
         pass
+
+    def clear(self, session):
+        """Drops audio which has been written but not played yet (barge-in). Optional."""
+        pass
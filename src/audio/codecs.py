@@ -0,0 +1,154 @@
+import os
+import struct
+import warnings
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        # removed in Python 3.13; the audioop-lts package provides it again
+        import audioop
+    except ImportError:
+        audioop = None
+
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+
+# Codecs the server may use for the websocket audio, most preferred first. The browser announces
+# the ones it can decode when it connects; the first one both sides support is used.
+WS_AUDIO_CODECS = os.getenv("WS_AUDIO_CODECS", "opus,adpcm,ulaw,alaw,pcm")
+OPUS_BITRATE = int(os.getenv("WS_AUDIO_OPUS_BITRATE", 24000))
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class PCMEncoder:
+    """Raw int16 PCM (about 48 KB/s at 24 kHz). Encoders get int16 mono frames and return one websocket message."""
+    name = "pcm"
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+
+    def encode(self, pcm: bytes) -> bytes:
+        return pcm
+
+    def pending(self) -> bool:
+        """True if samples are held back until more audio (or `flush`) completes a codec frame."""
+        return False
+
+    def flush(self) -> bytes:
+        return b""
+
+    def reset(self) -> None:
+        """The audio was interrupted; the next frame starts a new stream."""
+        pass
+
+
+class MuLawEncoder(PCMEncoder):
+    """G.711 µ-law, 8 bits per sample (2x)."""
+    name = "ulaw"
+
+    def encode(self, pcm):
+        return audioop.lin2ulaw(pcm, 2)
+
+
+class ALawEncoder(PCMEncoder):
+    """G.711 A-law, 8 bits per sample (2x)."""
+    name = "alaw"
+
+    def encode(self, pcm):
+        return audioop.lin2alaw(pcm, 2)
+
+
+class ADPCMEncoder(PCMEncoder):
+    """
+    IMA-ADPCM, 4 bits per sample (4x). Each message starts with the encoder state
+    (int16 predictor, uint8 step index, uint8 padding nibble flag), so it can be decoded
+    on its own, e.g. after dropped or cleared audio.
+    """
+    name = "adpcm"
+
+    def __init__(self, sample_rate):
+        super().__init__(sample_rate)
+        self.state = None
+
+    def encode(self, pcm):
+        if len(pcm) % 4:
+            # odd number of samples: repeat the last one to fill the last byte
+            pcm += pcm[-2:]
+            padded = 1
+        else:
+            padded = 0
+        predictor, index = self.state or (0, 0)
+        data, self.state = audioop.lin2adpcm(pcm, 2, self.state)
+        return struct.pack("<hBB", predictor, index, padded) + data
+
+    def reset(self):
+        self.state = None
+
+
+class OpusEncoder(PCMEncoder):
+    """
+    Opus (about 3 KB/s at 24 kbit/s). A message holds 20 ms packets, each prefixed with its
+    length as uint16. Samples which do not fill a whole packet wait for the next frame.
+    """
+    name = "opus"
+    packet_ms = 20
+
+    def __init__(self, sample_rate):
+        super().__init__(sample_rate)
+        self.packet_bytes = sample_rate * self.packet_ms // 1000 * 2
+        self.rest = b""
+        self.reset()
+
+    def encode(self, pcm):
+        pcm = self.rest + pcm
+        whole = len(pcm) - len(pcm) % self.packet_bytes
+        self.rest = pcm[whole:]
+        return b"".join(self._packet(pcm[start:start + self.packet_bytes]) for start in range(0, whole, self.packet_bytes))
+
+    def pending(self):
+        return len(self.rest) > 0
+
+    def flush(self):
+        if not self.rest:
+            return b""
+        # end of the audio: pad the last packet with silence
+        pcm, self.rest = self.rest.ljust(self.packet_bytes, b"\0"), b""
+        return self._packet(pcm)
+
+    def reset(self):
+        self.rest = b""
+        self.encoder = opuslib.Encoder(self.sample_rate, 1, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = OPUS_BITRATE
+
+    def _packet(self, pcm):
+        packet = self.encoder.encode(pcm, len(pcm) // 2)
+        return struct.pack("<H", len(packet)) + packet
+
+
+ENCODERS = {encoder.name: encoder for encoder in (OpusEncoder, ADPCMEncoder, MuLawEncoder, ALawEncoder, PCMEncoder)}
+
+
+def available(sample_rate):
+    """Codecs this server can encode at `sample_rate`."""
+    codecs = {"pcm"}
+    if audioop is not None:
+        codecs.update(("ulaw", "alaw", "adpcm"))
+    if opuslib is not None and sample_rate in OPUS_SAMPLE_RATES:
+        codecs.add("opus")
+    return codecs
+
+
+def negotiate(client_codecs, sample_rate):
+    """
+    Encoder for the codecs announced by the client (comma separated); raw PCM for clients which
+    announce nothing.
+    """
+    offered = {codec.strip() for codec in (client_codecs or "").split(",") if codec.strip()}
+    supported = available(sample_rate)
+    for name in WS_AUDIO_CODECS.split(","):
+        name = name.strip()
+        if name in offered and name in supported:
+            return ENCODERS[name](sample_rate)
+    return PCMEncoder(sample_rate)
@@ -1,18 +1,25 @@
-import pyaudio
-
 from audio.base_sink import BaseAudioSink
-from websocketmanager import WebSocketManager
+from websocketmanager import WebSocketManager, AUDIO_BLOCK_TIMEOUT
 
 class WebSocketSink(BaseAudioSink):
+    block_timeout = AUDIO_BLOCK_TIMEOUT
 
     def __init__(self):
-        self.close = False
+        self.closed = False
 
 
     def write(self, session, chunk):
-        if not self.close:
+        if not self.closed:
             WebSocketManager.send_bytes(session.ws_token, chunk)
 
+    def offer(self, session, chunk, wake):
+        if self.closed:
+            return True
+        return WebSocketManager.offer_bytes(session.ws_token, chunk, wake)
+
+    def clear(self, session):
+        WebSocketManager.clear_audio(session.ws_token)
+
     def close(self, session):
-        self.close = True
+        self.closed = True
 
@@ -0,0 +1,16 @@
+import importlib
+from typing import Dict
+
+
+def load_backend(backends: Dict[str, str], name: str):
+    """
+    Imports and returns the backend class registered as `name`. The registry values are
+    "module:ClassName" strings, so heavy libraries (torch, google-cloud, ...) are only
+    imported when their backend is actually selected.
+    """
+    name = name.strip().lower()
+    if name not in backends:
+        raise ValueError(f"Unknown backend '{name}'. Available: {', '.join(sorted(backends))}")
+    module_name, class_name = backends[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
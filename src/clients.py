@@ -0,0 +1,143 @@
+import os
+import json
+import asyncio
+import threading
+
+# Connection pool sizing for the provider clients. All sessions share these pools.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 120))
+# Re-warm the pools every N seconds (0 = only once at startup)
+CLIENT_KEEP_WARM_INTERVAL = float(os.getenv("CLIENT_KEEP_WARM_INTERVAL", 0))
+
+
+class ClientRegistry:
+    """
+    Process-wide provider clients (OpenAI, Google TTS, Gemini) with keep-alive connection pools.
+    Clients are created on first use and shared by all sessions; the provider libraries are
+    imported only when the corresponding client is requested.
+    """
+    _lock = threading.Lock()
+    _clients = {}
+
+
+    @classmethod
+    def _get(cls, key, factory):
+        client = cls._clients.get(key)
+        if client is None:
+            with cls._lock:
+                client = cls._clients.get(key)
+                if client is None:
+                    client = factory()
+                    cls._clients[key] = client
+        return client
+
+
+    @classmethod
+    def _httpx_limits(cls):
+        import httpx
+        return httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+
+
+    @classmethod
+    def openai(cls):
+        def factory():
+            import openai
+            return openai.OpenAI(http_client=openai.DefaultHttpxClient(limits=cls._httpx_limits()))
+        return cls._get("openai", factory)
+
+
+    @classmethod
+    def async_openai(cls):
+        def factory():
+            import openai
+            return openai.AsyncOpenAI(http_client=openai.DefaultAsyncHttpxClient(limits=cls._httpx_limits()))
+        return cls._get("async_openai", factory)
+
+
+    @classmethod
+    def google_tts(cls):
+        def factory():
+            import google.cloud.texttospeech as tts
+            return tts.TextToSpeechClient()
+        return cls._get("google_tts", factory)
+
+
+    @classmethod
+    def gemini(cls):
+        """Returns the configured `google.generativeai` module."""
+        def factory():
+            import google.generativeai as genai
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("API key 'GEMINI_API_KEY' not found in environment variables.")
+            genai.configure(api_key=api_key)
+            return genai
+        return cls._get("gemini", factory)
+
+
+    @classmethod
+    def gemini_model_info(cls, model_name):
+        return cls._get(("gemini_model_info", model_name), lambda: cls.gemini().get_model(f"models/{model_name}"))
+
+
+    @classmethod
+    def gemini_token_model(cls, model_name):
+        """Plain model without any config; only used for token counting."""
+        return cls._get(("gemini_token_model", model_name), lambda: cls.gemini().GenerativeModel(f"models/{model_name}"))
+
+
+    @classmethod
+    def gemini_model(cls, model_name, system_instruction=None, generation_config=None, safety_settings=None):
+        """
+        Shared `GenerativeModel` per (model, system prompt, config). The model object holds no
+        conversation state, so all sessions with the same prompt and config can use the same one.
+        """
+        key = ("gemini_model", model_name, system_instruction,
+               json.dumps(generation_config, sort_keys=True), json.dumps(safety_settings, sort_keys=True))
+        return cls._get(key, lambda: cls.gemini().GenerativeModel(
+            model_name=model_name,
+            generation_config=generation_config,
+            system_instruction=system_instruction,
+            safety_settings=safety_settings))
+
+
+    @classmethod
+    def warm_up(cls):
+        """Opens the connections of all providers which are configured in the environment."""
+        if os.getenv("OPENAI_API_KEY"):
+            cls._warm("OpenAI", lambda: cls.openai().models.list())
+        if os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+            cls._warm("Google TTS", lambda: cls.google_tts().list_voices(language_code="de-DE"))
+        if os.getenv("GEMINI_API_KEY"):
+            cls._warm("Gemini", lambda: cls.gemini().get_model("models/gemini-1.5-flash"))
+
+
+    @classmethod
+    async def awarm_up(cls):
+        """Warms the blocking clients in a worker thread and the async OpenAI client on the running loop."""
+        await asyncio.to_thread(cls.warm_up)
+        if os.getenv("OPENAI_API_KEY"):
+            try:
+                await cls.async_openai().models.list()
+            except Exception as e:
+                print(f"Warm-up of async OpenAI client failed: {e}")
+
+
+    @classmethod
+    async def keep_warm(cls, interval=CLIENT_KEEP_WARM_INTERVAL):
+        await cls.awarm_up()
+        while interval > 0:
+            await asyncio.sleep(interval)
+            await cls.awarm_up()
+
+
+    @staticmethod
+    def _warm(name, call):
+        try:
+            call()
+            print(f"{name} client warmed up")
+        except Exception as e:
+            print(f"Warm-up of {name} client failed: {e}")
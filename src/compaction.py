@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+import threading
+from types import SimpleNamespace
+from collections import OrderedDict
+
+from llm.factory import LLMFactory
+from llm.base import FALLBACK_ANSWER
+
+# Estimated history tokens above which the older messages are summarized (0 = off)
+HISTORY_COMPACTION_THRESHOLD = int(os.getenv("HISTORY_COMPACTION_THRESHOLD", 2500))
+# Newest messages which always stay verbatim
+HISTORY_COMPACTION_KEEP = int(os.getenv("HISTORY_COMPACTION_KEEP", 6))
+SUMMARY_CACHE_SIZE = 256
+
+SUMMARY_PROMPT = """
+    Du fasst den Verlauf eines Text-Adventures für den Erzähler zusammen. Behalte alles, was für den
+    weiteren Spielverlauf wichtig ist: Orte, Gegenstände, Personen, Entscheidungen und offene Aufgaben
+    des Spielers. Schreibe sachlich, ohne Einleitung und mit höchstens 150 Wörtern.
+"""
+SUMMARY_PREFIX = "Zusammenfassung des bisherigen Gesprächs: "
+
+# summary per digest of the summarized messages; shared by all sessions (e.g. same intro)
+_summaries = OrderedDict()
+_summaries_lock = threading.Lock()
+
+
+def estimate_tokens(history):
+    return sum(len(message["content"]) // 4 + 4 for message in history)
+
+
+def _digest(messages):
+    return hashlib.sha256(json.dumps(messages, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class Compaction:
+    """Summary of the messages `messages`, created in a background thread."""
+    def __init__(self, messages):
+        self.messages = messages
+        self.key = _digest(messages)
+        self.summary = None
+        self.done = threading.Event()
+        with _summaries_lock:
+            self.summary = _summaries.get(self.key)
+        if self.summary is not None:
+            self.done.set()
+        else:
+            threading.Thread(target=self._summarize, daemon=True).start()
+
+
+    def _summarize(self):
+        try:
+            summarizer = LLMFactory.create()
+            summarizer.raise_errors = True
+            transcript = "\n".join(f'{message["role"]}: {message["content"]}' for message in self.messages)
+            result = summarizer.chat(SimpleNamespace(system_prompt=SUMMARY_PROMPT), transcript)
+            text = (result.get("text") or "").strip()
+            # a canned error answer must never replace the story
+            if text and text != FALLBACK_ANSWER:
+                self.summary = text
+                with _summaries_lock:
+                    _summaries[self.key] = self.summary
+                    while len(_summaries) > SUMMARY_CACHE_SIZE:
+                        _summaries.popitem(last=False)
+        except Exception as e:
+            print(f"History compaction failed: {e}")
+        finally:
+            self.done.set()
+
+
+class HistoryCompactor:
+    """
+    Keeps long histories short without forgetting the story: once the history grows above
+    HISTORY_COMPACTION_THRESHOLD, everything except the newest messages is summarized in the
+    background (`schedule`, after a turn). The summary replaces these messages at the start of
+    the next turn (`apply`), so neither step is on the request path of the LLM.
+    """
+
+    @staticmethod
+    def schedule(session):
+        if HISTORY_COMPACTION_THRESHOLD <= 0 or session.compaction is not None:
+            return
+        try:
+            history = session.llm.get_history()
+        except NotImplementedError:
+            return
+        if len(history) <= HISTORY_COMPACTION_KEEP or estimate_tokens(history) < HISTORY_COMPACTION_THRESHOLD:
+            return
+        print(f"Compacting {len(history) - HISTORY_COMPACTION_KEEP} messages of the history")
+        session.compaction = Compaction(history[:-HISTORY_COMPACTION_KEEP])
+
+
+    @staticmethod
+    def apply(session):
+        compaction = session.compaction
+        if compaction is None or not compaction.done.is_set():
+            return
+        session.compaction = None
+        if compaction.summary is None:
+            return
+        history = session.llm.get_history()
+        count = len(compaction.messages)
+        # the history may have been reset or trimmed in the meantime
+        if history[:count] != compaction.messages:
+            return
+        summary = {"role": "system", "content": SUMMARY_PREFIX + compaction.summary}
+        session.llm.set_history([summary] + history[count:])
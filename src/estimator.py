@@ -15,9 +15,10 @@ class Estimator:
 
 
     @staticmethod
-    def estimate_tag_locations(text: str) -> List[Tuple[str, float]]:
+    def estimate_tag_locations(text: str, offset_characters: int = 0) -> List[Tuple[str, float]]:
         """
         Identifies tags in the text and calculates the estimated duration up to each tag's position.
+        `offset_characters` is the number of already spoken characters before `text` (streaming mode).
         
         Returns:
             List of tuples containing (tag_content, estimated_duration).
@@ -39,7 +40,7 @@ class Estimator:
             text_before_tag = text[:start]
             cleaned_text += text_before_tag
 
-            characters_up_to_tag = len(cleaned_text)
+            characters_up_to_tag = offset_characters + len(cleaned_text)
             estimated_duration = Estimator.estimate_duration(characters_up_to_tag)
             print(estimated_duration)
             tag_durations.append((tag_content, estimated_duration))
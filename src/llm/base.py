@@ -1,7 +1,19 @@
 import abc
+import asyncio
+
+# canned answer of the backends if a request failed and `raise_errors` is not set
+FALLBACK_ANSWER = "I'm sorry, there was an issue processing your request."
+
 
 # Definition of BaseLLM class (could be extended in the future with more functionalities)
 class BaseLLM(abc.ABC):
+    # post-processing applied by the SentenceSegmenter on streamed answers
+    stream_drop_phrases = []
+    stream_stop_markers = []
+    # set by ResilientLLM (and other callers which must not take the canned text for an answer):
+    # errors are raised instead of being answered with FALLBACK_ANSWER, and there are no retries
+    raise_errors = False
+
     def __init__(self):
         pass
 
@@ -9,6 +21,23 @@ class BaseLLM(abc.ABC):
     def chat(self, user_input):
         pass
 
+    async def achat(self, session, user_input):
+        """
+        Async variant of `chat` for the server. Backends should override this with a native
+        async implementation; the fallback runs the blocking call in a worker thread so that
+        the event loop is never blocked.
+        """
+        return await asyncio.to_thread(self.chat, session, user_input)
+
+    async def astream(self, session, user_input):
+        """
+        Yields the answer as text deltas while it is generated. The history is updated once the
+        stream is exhausted. The fallback yields the complete answer of `achat` at once.
+        """
+        result = await self.achat(session, user_input)
+        if result.get("text"):
+            yield result["text"]
+
     @abc.abstractmethod
     def system(self, system_instruction):
         pass
@@ -19,6 +48,24 @@ class BaseLLM(abc.ABC):
         pass
 
 
+    def cache_id(self):
+        """Backend and model, e.g. for caches of generated answers (see turncache.py)."""
+        return (type(self).__name__, getattr(self, "model_name", None))
+
+
+    def get_history(self):
+        """
+        Returns the conversation in the backend independent format
+        [{"role": "system" | "user" | "assistant", "content": str}, ...]
+        """
+        raise NotImplementedError
+
+
+    def set_history(self, history):
+        """Replaces the conversation with `history` (format see `get_history`)."""
+        raise NotImplementedError
+
+
     @abc.abstractmethod
     def reset(self, session):
         pass
@@ -1,12 +1,17 @@
-from llm.openai import OpenAILLM
-from llm.gemini import GeminiLLM
-from llm.gemini_remote_history import GeminiRemoteHistoryLLM
+import os
+from backends import load_backend
 
 class LLMFactory:
+    # select with the environment variable LLM_BACKEND
+    backends = {
+        "openai": "llm.openai:OpenAILLM",
+        "gemini": "llm.gemini:GeminiLLM",
+        "gemini_remote_history": "llm.gemini_remote_history:GeminiRemoteHistoryLLM",
+        # hedging and failover across the backends listed in LLM_FAILOVER
+        "resilient": "llm.resilient:ResilientLLM",
+    }
+    default = "openai"
 
     @classmethod
-    def create(cls):
-        return OpenAILLM()
-        #return GeminiLLM()
-        #return GeminiRemoteHistoryLLM()
-
+    def create(cls, name=None):
+        return load_backend(cls.backends, name or os.getenv("LLM_BACKEND", cls.default))()
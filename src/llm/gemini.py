@@ -1,18 +1,48 @@
-import os
 import time
+import asyncio
 import json
 import re
-
-import google.generativeai as genai
+import threading
+from collections import OrderedDict
 
 from llm.base import BaseLLM
+from clients import ClientRegistry
+
+# Exact token counts from the API, keyed by (model, text). Shared by all sessions, so the
+# intro and other repeated messages are counted only once per process. Least recently used
+# first out: the messages of histories which are still in use are looked up on every turn.
+TOKEN_COUNT_CACHE_SIZE = 4096
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def _cached_token_count(key):
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+        return count
+
+
+def _remember_token_count(key, count):
+    with _token_counts_lock:
+        _token_counts[key] = count
+        while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
 
 # Definition der Klasse OpenAILLM, die von BaseLLM erbt
 class GeminiLLM(BaseLLM):
+    stream_stop_markers = ["(Hinweis:"]
+    # local estimate for German text is ~4 characters per token; 3 errs on the safe side
+    chars_per_token = 3
+    # above this fraction of max_tokens the exact counts are fetched from the API
+    token_estimate_margin = 0.8
+
     def __init__(self):
         super().__init__()
         self.max_tokens= 8192
         self.history = []
+        self.chat_session = None
         self.model_name = "gemini-1.5-flash"      # latest
         #self.model_name = "gemini-1.5-pro"  # stable
         self.generation_config = {
@@ -22,14 +52,11 @@ class GeminiLLM(BaseLLM):
             "max_output_tokens": 210, #self.max_tokens,
             "response_mime_type": "text/plain",
         }
-        self.api_key=os.environ["GEMINI_API_KEY"]
-        if not self.api_key:
-            raise ValueError("API key 'GEMINI_API_KEY' not found in environment variables.")
-        genai.configure(api_key=self.api_key)
-        self.model_info = genai.get_model(f"models/{self.model_name}")
+        ClientRegistry.gemini()
+        self.model_info = ClientRegistry.gemini_model_info(self.model_name)
 
         # just for token count....not for Q&A or anything else
-        self.token_model = genai.GenerativeModel(f"models/{self.model_name}")
+        self.token_model = ClientRegistry.gemini_token_model(self.model_name)
 
         # Returns the "context window" for the model,
         # which is the combined input and output token limits.
@@ -45,6 +72,17 @@ class GeminiLLM(BaseLLM):
         self.history = []
 
 
+    def get_history(self):
+        return [{"role": "assistant" if entry["role"] == "model" else "user", "content": " ".join(entry["parts"])}
+                for entry in self.history]
+
+
+    def set_history(self, history):
+        self.history = []
+        for message in history:
+            self._add_to_history(role="user" if message["role"] == "user" else "model", message=message["content"])
+
+
     def system(self, system_instruction):
         if system_instruction:
             self._add_to_history(role="model", message=system_instruction.replace(f'\n', ''))
@@ -61,7 +99,53 @@ class GeminiLLM(BaseLLM):
         # Erster Modellaufruf mit "function_calling_config" auf "ANY" um zu versuchen "action" und "text" zu bekommen
         #
         result = self._get_response_with_config(session,  user_input)
+        return self._finish_turn(user_input, result)
+
+
+    async def achat(self, session, user_input):
+        if not user_input:
+            print("Error: No user input provided.")
+            return {"text": "No input provided.", "expressions": [], "action": None}
 
+        user_input = user_input.replace(f'\n', '')
+
+        await self._atrim_history_to_fit(user_input)
+        result = await self._aget_response_with_config(session, user_input)
+        return self._finish_turn(user_input, result)
+
+
+    async def astream(self, session, user_input):
+        if not user_input:
+            yield "No input provided."
+            return
+
+        user_input = user_input.replace(f'\n', '')
+        await self._atrim_history_to_fit(user_input)
+
+        parts = []
+        try:
+            chat_session = self._create_chat_session(session)
+            response = await chat_session.send_message_async(user_input, stream=True)
+            async for chunk in response:
+                for part in chunk.parts:
+                    if part.text:
+                        parts.append(part.text)
+                        yield part.text
+        except Exception as e:
+            print(e)
+            if self.raise_errors:
+                raise
+
+        if not parts:
+            # nothing streamed (e.g. error before the first chunk) => fall back to the retrying request
+            result = await self._aget_response_with_config(session, user_input)
+            if result["text"]:
+                parts.append(result["text"])
+                yield result["text"]
+        self._finish_turn(user_input, {"text": "".join(parts), "expressions": [], "action": None})
+
+
+    def _finish_turn(self, user_input, result):
         # remove the fucking Gemini prompt append....
         text = result["text"]
         text = text[:text.find("(Hinweis:")] if "(Hinweis:" in text else text
@@ -93,62 +177,138 @@ class GeminiLLM(BaseLLM):
             self.history.append({"role": role, "parts": [message]})
 
 
+    def _create_chat_session(self, session):
+        model = ClientRegistry.gemini_model(
+            self.model_name,
+            system_instruction=session.system_prompt,
+            generation_config=self.generation_config,
+            safety_settings={
+                'HATE': 'BLOCK_NONE',
+                'HARASSMENT': 'BLOCK_NONE',
+                'SEXUAL': 'BLOCK_NONE',
+                'DANGEROUS': 'BLOCK_NONE'
+            }
+        )
+        # reuse the chat object as long as the model is the same; only the history is replaced,
+        # because self.history (trimmed, cleaned up) is the source of truth
+        if self.chat_session is None or self.chat_session.model is not model:
+            self.chat_session = model.start_chat(history=self.history)
+        else:
+            self.chat_session.history = self.history
+        return self.chat_session
+
+
+    def _parse_response(self, response):
+        result = {"text": None, "expressions": [], "action": None}
+
+        # Process response parts
+        for part in response.parts:
+            if part.text and not result["text"]:
+                result["text"] = part.text
+        return result
+
+
     def _get_response_with_config(self, session, user_input):
         max_retries = 2
         attempt = 0
         
         while attempt <= max_retries:
             try:
-                model = genai.GenerativeModel(
-                    model_name=self.model_name,
-                    generation_config=self.generation_config,
-                    system_instruction=session.system_prompt,
-                    
-                    safety_settings={
-                        'HATE': 'BLOCK_NONE',
-                        'HARASSMENT': 'BLOCK_NONE',
-                        'SEXUAL': 'BLOCK_NONE',
-                        'DANGEROUS': 'BLOCK_NONE'
-                    }
-                )
-
-                chat_session = model.start_chat( history=self.history)
+                chat_session = self._create_chat_session(session)
                 response = chat_session.send_message(user_input)
-                result = {"text": None, "expressions": [], "action": None}
+                return self._parse_response(response)  # Exit the loop and function if successful
 
-                # Process response parts
-                for part in response.parts:
-                    if part.text and not result["text"]:
-                        result["text"] = part.text
+            except Exception as e:
+                print(e)
+                print(json.dumps(self.history, indent=4))
+                if self.raise_errors:
+                    raise
+                attempt += 1
+                if attempt > max_retries:
+                    print("Max retries reached. Returning empty result.")
+                    return {"text": "Error: Unable to get response after multiple attempts.", "expressions": [], "action": None}
+                time.sleep(0.1)
+
+
+    async def _aget_response_with_config(self, session, user_input):
+        max_retries = 2
+        attempt = 0
 
-                return result  # Exit the loop and function if successful
+        while attempt <= max_retries:
+            try:
+                chat_session = self._create_chat_session(session)
+                response = await chat_session.send_message_async(user_input)
+                return self._parse_response(response)
 
             except Exception as e:
                 print(e)
                 print(json.dumps(self.history, indent=4))
+                if self.raise_errors:
+                    raise
                 attempt += 1
                 if attempt > max_retries:
                     print("Max retries reached. Returning empty result.")
                     return {"text": "Error: Unable to get response after multiple attempts.", "expressions": [], "action": None}
-                time.sleep(0.1)
+                await asyncio.sleep(0.1)
 
 
     def _trim_history_to_fit(self, user_input):
         """Trim history to fit within token limit when adding user input."""
-        # Calculate tokens needed for user_input
+        # far below the limit the local estimate is enough; no API call at all
+        if self._estimate_token_count(user_input) <= self.max_tokens * self.token_estimate_margin:
+            return
+
+        # close to the limit: exact counts (memoized, so only new messages cost a request)
         input_tokens = self._calculate_token_count(user_input)
-        
-        # Calculate current history token count
-        history_tokens = sum(self._calculate_token_count(entry["parts"][0]) for entry in self.history)
-        
-        # Trim history if total tokens exceed max allowed tokens
+        counts = [sum(self._calculate_token_count(part) for part in entry["parts"]) for entry in self.history]
+        self._drop_oldest(counts, input_tokens)
+
+
+    async def _atrim_history_to_fit(self, user_input):
+        """Async variant of `_trim_history_to_fit`."""
+        if self._estimate_token_count(user_input) <= self.max_tokens * self.token_estimate_margin:
+            return
+
+        texts = [user_input] + [part for entry in self.history for part in entry["parts"]]
+        await asyncio.gather(*(self._acalculate_token_count(text) for text in set(texts)))
+        input_tokens = self._calculate_token_count(user_input)
+        counts = [sum(self._calculate_token_count(part) for part in entry["parts"]) for entry in self.history]
+        self._drop_oldest(counts, input_tokens)
+
+
+    def _drop_oldest(self, counts, input_tokens):
+        history_tokens = sum(counts)
+        removed = 0
         while history_tokens + input_tokens > self.max_tokens and self.history:
-            # Remove oldest entry
-            removed_entry = self.history.pop(0)
-            history_tokens -= self._calculate_token_count(removed_entry["parts"][0])
+            self.history.pop(0)
+            history_tokens -= counts[removed]
+            removed += 1
 
 
-    def _calculate_token_count(self, text):
-        """Calculate token count for a given text using the Gemini API."""
-        return self.token_model.count_tokens(text).total_tokens
+    def _estimate_token_count(self, user_input):
+        """
+        Local, slightly pessimistic estimate of history + input. Texts which have been counted
+        exactly before use their cached count.
+        """
+        texts = [user_input] + [part for entry in self.history for part in entry["parts"]]
+        return sum(_cached_token_count((self.model_name, text)) or len(text) / self.chars_per_token
+                   for text in texts)
 
+
+    async def _acalculate_token_count(self, text):
+        key = (self.model_name, text)
+        count = _cached_token_count(key)
+        if count is None:
+            count = (await self.token_model.count_tokens_async(text)).total_tokens
+            _remember_token_count(key, count)
+        return count
+
+
+    def _calculate_token_count(self, text):
+        """Calculate token count for a given text using the Gemini API (memoized)."""
+        key = (self.model_name, text)
+        count = _cached_token_count(key)
+        if count is None:
+            count = self.token_model.count_tokens(text).total_tokens
+            _remember_token_count(key, count)
+        return count
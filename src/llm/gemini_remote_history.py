@@ -1,10 +1,54 @@
-import os
 import time
+import asyncio
 import json
+import threading
+from collections import OrderedDict
 import google.generativeai as genai
 from google.generativeai.types import content_types
 
 from llm.base import BaseLLM
+from clients import ClientRegistry
+
+_safety_settings=[
+    {"category": "HARM_CATEGORY_HARASSMENT"        ,"threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH"       ,"threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT" ,"threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT" ,"threshold": "BLOCK_NONE"}
+]
+
+_tool_config_auto = content_types.to_tool_config({ "function_calling_config": { "mode": "AUTO"} })
+_tool_config_none = content_types.to_tool_config({ "function_calling_config": { "mode": "NONE"} })
+
+# Tool declarations per set of (action, description); shared by all sessions. A new entry is
+# only built when the state engine offers a different set of actions.
+TOOL_CACHE_SIZE = 256
+_tool_cache = OrderedDict()
+_tool_cache_lock = threading.Lock()
+
+
+def _tools_for(actions):
+    with _tool_cache_lock:
+        tools = _tool_cache.get(actions)
+        if tools is not None:
+            _tool_cache.move_to_end(actions)
+            return tools
+    tools = [
+        genai.protos.Tool(
+            function_declarations=[
+                genai.protos.FunctionDeclaration(
+                    name=action,
+                    description=description,
+                    parameters=None
+                )
+            ]
+        )
+        for action, description in actions
+    ]
+    with _tool_cache_lock:
+        _tool_cache[actions] = tools
+        while len(_tool_cache) > TOOL_CACHE_SIZE:
+            _tool_cache.popitem(last=False)
+    return tools
 
 
 class GeminiRemoteHistoryLLM(BaseLLM):
@@ -20,10 +64,7 @@ class GeminiRemoteHistoryLLM(BaseLLM):
             "response_mime_type": "text/plain",
         }
 
-        self.api_key=os.environ["GEMINI_API_KEY"]
-        if not self.api_key:
-            raise ValueError("API key 'GEMINI_API_KEY' not found in environment variables.")
-        genai.configure(api_key=self.api_key)
+        ClientRegistry.gemini()
 
         self.instruction_addon = f"""
             Ich wähle je nach Gesprächskontext und nur auf expliziten Wunsch des Benutzers die 
@@ -33,10 +74,14 @@ class GeminiRemoteHistoryLLM(BaseLLM):
 
             Wenn keine der bereitgestellten Funktionen dem Befehl des Nutzers entspricht, fahre ich ohne technische 
             Hinweise oder Rückmeldung ganz normal im Gesprächsverlauf fort, ohne eine Funktion auszuführen.
+
+            Wenn ich eine Funktion aufrufe, antworte ich in derselben Antwort immer auch mit einem kurzen Text,
+            in dem ich dem Benutzer erzähle, was ich gerade tue.
         """
         #self.instruction_addon =""
         self.model = None
         self.chat_session = None
+        self.restored_history = []
 
 
     def dump(self):
@@ -60,6 +105,29 @@ class GeminiRemoteHistoryLLM(BaseLLM):
             print(f"An unexpected error occurred: {e}")
 
 
+    def get_history(self):
+        if self.chat_session is None:
+            return list(self.restored_history)
+        history = []
+        for msg in self.chat_session.history:
+            text = ' '.join(part.text for part in msg.parts if part.text)
+            if text:
+                history.append({"role": "assistant" if msg.role == "model" else "user", "content": text})
+        return history
+
+
+    def set_history(self, history):
+        self.restored_history = list(history)
+        if self.model is not None:
+            self.chat_session = self._start_chat()
+
+
+    def _start_chat(self):
+        history = [{"role": "user" if message["role"] == "user" else "model", "parts": [message["content"]]}
+                   for message in self.restored_history]
+        return self.model.start_chat(history=history, enable_automatic_function_calling=False)
+
+
     def system(self, system_instruction):
         if system_instruction:
             self.chat_session.send_message("System instruction: "+system_instruction.replace(f'\n', ''))
@@ -67,8 +135,8 @@ class GeminiRemoteHistoryLLM(BaseLLM):
 
     def reset(self, session):
         if self.model==None:
-            self.model = genai.GenerativeModel(
-                model_name=self.model_name,
+            self.model = ClientRegistry.gemini_model(
+                self.model_name,
                 generation_config=self.generation_config,
                 safety_settings={
                     'HATE': 'BLOCK_NONE',
@@ -78,7 +146,8 @@ class GeminiRemoteHistoryLLM(BaseLLM):
                 },
                 system_instruction=session.state_engine.get_global_system_prompt()+". "+self.instruction_addon,
             )
-        self.chat_session = self.model.start_chat(enable_automatic_function_calling=False)
+        self.restored_history = []
+        self.chat_session = self._start_chat()
 
 
     def chat(self, session, user_input):
@@ -86,10 +155,47 @@ class GeminiRemoteHistoryLLM(BaseLLM):
             print("Error: No user input provided.")
             return {"text": "No input provided.", "expressions": [], "action": None}
 
+        tools = self._prepare_turn(session)
+
+        # Modellaufruf mit "function_calling_config" auf "AUTO"; laut Instruktion kommen "action" und "text"
+        # in derselben Antwort
+        #
+        result = self._get_response_with_config(user_input, tools, _tool_config_auto)
+
+        # Falls Gemini trotzdem nur "action" geliefert hat, dann starten wir einen zweiten Aufruf um uns nur eine "text" Antwort abzuholen.
+        # Kann manchmal passieren. AI = fuzzy
+        #
+        if result["text"] is None:
+            second_input = self._second_input(session, result, user_input)
+            second_result = self._get_response_with_config(second_input, tools, _tool_config_none)
+            self._merge_results(result, second_result)
+
+        return result
+
+
+    async def achat(self, session, user_input):
+        if not user_input:
+            print("Error: No user input provided.")
+            return {"text": "No input provided.", "expressions": [], "action": None}
+
+        tools = self._prepare_turn(session)
+
+        result = await self._aget_response_with_config(user_input, tools, _tool_config_auto)
+
+        if result["text"] is None:
+            second_input = self._second_input(session, result, user_input)
+            second_result = await self._aget_response_with_config(second_input, tools, _tool_config_none)
+            self._merge_results(result, second_result)
+
+        return result
+
+
+    def _prepare_turn(self, session):
+        """Creates the chat session on first use and returns the tools for the current state."""
         if self.chat_session==None:
             print("Generate Chat Session")
-            self.model = genai.GenerativeModel(
-                model_name=self.model_name,
+            self.model = ClientRegistry.gemini_model(
+                self.model_name,
                 generation_config=self.generation_config,
                 safety_settings={
                     'HATE': 'BLOCK_NONE',
@@ -99,82 +205,82 @@ class GeminiRemoteHistoryLLM(BaseLLM):
                 },
                 system_instruction=session.state_engine.get_global_system_prompt()+" "+self.instruction_addon,
             )
-            self.chat_session = self.model.start_chat( enable_automatic_function_calling=False)
+            self.chat_session = self._start_chat()
             print(session.state_engine.get_global_system_prompt()+" "+self.instruction_addon)
 
 
-        #user_input = user_input.replace(f'\n', '')
-        tools = [
-            genai.protos.Tool(
-                function_declarations=[
-                    genai.protos.FunctionDeclaration(
-                        name=action,
-                        description=session.state_engine.get_action_description(action),
-                        parameters=None
-                    )
-                ]
-            )
-            for action in session.state_engine.get_possible_actions()
-        ]
-        print(json.dumps(session.state_engine.get_possible_actions(), indent=4))
+        actions = tuple((action, session.state_engine.get_action_description(action))
+                        for action in session.state_engine.get_possible_actions())
+        tools = _tools_for(actions)
+        print(json.dumps([action for action, _ in actions], indent=4))
+        return tools
 
-        # Erster Modellaufruf mit "function_calling_config" auf "ANY" um zu versuchen "action" und "text" zu bekommen
-        #
-        tool_config = content_types.to_tool_config({ "function_calling_config": { "mode": "AUTO"} })
-        result = self._get_response_with_config(user_input, tools, tool_config)
-        action = result["action"]
 
-        # Falls Gemini nur "action" geliefert hat, dann starten wir einen zweiten Aufruf um uns nur eine "text" Antwort abzuholen.
-        # Kann manchmal passieren. AI = fuzzy
-        #
-        if result["text"] is None:
-            tool_config= content_types.to_tool_config({ "function_calling_config": {"mode": "NONE"}})
-            #"No text response; retrying with function_calling_config set to 'NONE'.")
-            if action in session.state_engine.get_possible_actions():
-                second_result = self._get_response_with_config(f"""
-                    SYSTEM: Du hast die Aktion '{result["action"]}' erfolgreich im Hintergrund ausgeführt. Bitte teile dies nun dem Benutzer mit, was du getan hast:
-                    User: """+ user_input, tools, tool_config)
-            else:
-                result["action"] = None
-                second_result = self._get_response_with_config(user_input, tools, tool_config)
-
-            # Merging der Antworten
-            result["text"] = second_result["text"] if result["text"] is None else result["text"]
-            if result["action"] is None and second_result["action"] is not None:
-                result["action"] = second_result["action"]
+    def _second_input(self, session, result, user_input):
+        """Input for the second call if Gemini delivered only an "action" but no text."""
+        #"No text response; retrying with function_calling_config set to 'NONE'.")
+        if result["action"] in session.state_engine.get_possible_actions():
+            return f"""
+                SYSTEM: Du hast die Aktion '{result["action"]}' erfolgreich im Hintergrund ausgeführt. Bitte teile dies nun dem Benutzer mit, was du getan hast:
+                User: """+ user_input
+        result["action"] = None
+        return user_input
 
+
+    def _merge_results(self, result, second_result):
+        # Merging der Antworten
+        result["text"] = second_result["text"] if result["text"] is None else result["text"]
+        if result["action"] is None and second_result["action"] is not None:
+            result["action"] = second_result["action"]
+
+
+    def _parse_response(self, response):
+        result = {"text": None, "expressions": [], "action": None}
+
+        # Process response parts
+        for part in response.parts:
+            if part.text and not result["text"]:
+                result["text"] = part.text
+            if part.function_call and not result["action"]:
+                result["action"] = part.function_call.name
         return result
 
 
+    async def _aget_response_with_config(self, user_input, tools, tool_config):
+        max_retries = 2
+        attempt = 0
+
+        while attempt <= max_retries:
+            try:
+                response = await self.chat_session.send_message_async(
+                    user_input,
+                    tools= tools,
+                    tool_config=tool_config,
+                    safety_settings = _safety_settings)
+                return self._parse_response(response)
+
+            except Exception as e:
+                print(e)
+                attempt += 1
+                if attempt > max_retries:
+                    print("Max retries reached. Returning empty result.")
+                    return {"text": "Error: Unable to get response after multiple attempts.", "expressions": [], "action": None}
+                await asyncio.sleep(0.1)
+
+
     def _get_response_with_config(self, user_input, tools, tool_config):
         max_retries = 2
         attempt = 0
         
         while attempt <= max_retries:
             try:
-                safety_settings=[
-                    {"category": "HARM_CATEGORY_HARASSMENT"        ,"threshold": "BLOCK_NONE"},
-                    {"category": "HARM_CATEGORY_HATE_SPEECH"       ,"threshold": "BLOCK_NONE"},
-                    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT" ,"threshold": "BLOCK_NONE"},
-                    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT" ,"threshold": "BLOCK_NONE"}
-                ]
-
                 response = self.chat_session.send_message(
                     user_input, 
                     tools= tools, 
                     tool_config=tool_config,
-                    safety_settings = safety_settings)
-
-                result = {"text": None, "expressions": [], "action": None}
-
-                # Process response parts
-                for part in response.parts:
-                    if part.text and not result["text"]:
-                        result["text"] = part.text
-                    if part.function_call and not result["action"]:
-                        result["action"] = part.function_call.name
+                    safety_settings = _safety_settings)
 
-                return result  # Exit the loop and function if successful
+                return self._parse_response(response)  # Exit the loop and function if successful
 
             except Exception as e:
                 print(e)
@@ -1,11 +1,13 @@
 import openai
-from openai import OpenAI
 import json
+from collections import deque
 
 import tiktoken
 import os
+import functools
 
-from llm.base import BaseLLM
+from llm.base import BaseLLM, FALLBACK_ANSWER
+from clients import ClientRegistry
 
 def make_serializable(obj):
     """Convert an object to a form that is JSON serializable."""
@@ -21,8 +23,33 @@ def make_serializable(obj):
         return str(obj)
 
 
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(encoding_name):
+    # encodings are immutable and thread-safe; all sessions share one instance
+    return tiktoken.get_encoding(encoding_name)
+
+
+# Tokens the chat format adds per message (role, separators)
+TOKENS_PER_MESSAGE = 4
+
+
+class Message:
+    """History entry which knows its token count, so the history never has to be re-encoded."""
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role, content, tokens):
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+
 # Definition der Klasse OpenAILLM, die von BaseLLM erbt
 class OpenAILLM(BaseLLM):
+    stream_drop_phrases = ["Was möchtest du als nächstes tun?"]
+
     def __init__(self):
         super().__init__()
         #self.model = "gpt-4"
@@ -30,29 +57,48 @@ class OpenAILLM(BaseLLM):
         #self.model = "gpt-4o-mini"
         #self.model = "gpt-4o"
 
-        self.history = []
+        self.history = deque()
+        self.history_tokens = 0     # running total of all Message.tokens in the history
         self.max_tokens = 2048
         self.stop = None
         self.frequency_penalty = 0
         self.presence_penalty = 0
         self.temperature = 0.1
         self.top_p = 0.95
-        self.token_limit = 4000 
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.token_limit = 4000     # max. tokens of system prompt + history
+        self.context_window = 16385 # prompt + completion limit of the model
+        self.tokenizer = get_tokenizer("cl100k_base")
         
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("API key for OpenAI not found in environment variables.")
      
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = ClientRegistry.openai()
+        self.async_client = ClientRegistry.async_openai()
 
 
     def dump(self):
-        print(json.dumps(self.history, indent=4))
+        print(json.dumps(self.get_history(), indent=4))
+        print(f"History tokens: {self.history_tokens}")
 
 
     def reset(self, session):
-        self.history = []
+        self.history = deque()
+        self.history_tokens = 0
+
+
+    def cache_id(self):
+        return (type(self).__name__, self.model)
+
+
+    def get_history(self):
+        return [message.to_dict() for message in self.history]
+
+
+    def set_history(self, history):
+        self.reset(None)
+        for message in history:
+            self._append(message["role"], message["content"])
 
 
     def system(self, system_instruction):
@@ -67,57 +113,136 @@ class OpenAILLM(BaseLLM):
             print("Warning: No message provided.")
             return
         
-        if self.history and self.history[-1]["role"] == role and self.history[-1]["content"] == message:
+        if self.history and self.history[-1].role == role and self.history[-1].content == message:
             print("Duplicate message detected; not adding to history.")
             return
         
-        self.history.append({"role": role, "content": message})
+        self._append(role, message)
+
+
+    def _append(self, role, content):
+        message = Message(role, content, self._count_tokens(content))
+        self.history.append(message)
+        self.history_tokens += message.tokens
 
 
     def chat(self, session, user_input):
         if not user_input:
             return {"text": "No input provided.", "expressions": [], "action": None}
         self._add_to_history("user", user_input)
-        self._trim_history()
+        self._trim_history(session)
 
         response = self._call_openai_model(session)
+        return self._finish_turn(response)
+
+
+    async def achat(self, session, user_input):
+        if not user_input:
+            return {"text": "No input provided.", "expressions": [], "action": None}
+        self._add_to_history("user", user_input)
+        self._trim_history(session)
+
+        response = await self._acall_openai_model(session)
+        return self._finish_turn(response)
+
+
+    async def astream(self, session, user_input):
+        if not user_input:
+            yield "No input provided."
+            return
+        self._add_to_history("user", user_input)
+        self._trim_history(session)
+
+        parts = []
+        try:
+            stream = await self.async_client.chat.completions.create(**self._request_args(session), stream=True)
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except openai.OpenAIError as e:
+            print(f"Error: {e}")
+            if self.raise_errors:
+                raise
+            if not parts:
+                parts.append(FALLBACK_ANSWER)
+                yield parts[0]
+        self._finish_turn({"text": "".join(parts)})
+
+
+    def _finish_turn(self, response):
         response["text"] =  response["text"].replace("Was möchtest du als nächstes tun?", "")
 
         self._add_to_history("assistant", response["text"])
         return response
     
 
-    def _call_openai_model(self, session):
+    def _request_args(self, session):
         combined_history = [
             {"role": "system", "content": session.system_prompt},
-        ] + self.history
+        ] + [message.to_dict() for message in self.history]
+
+        return dict(
+            model=self.model,
+            messages=combined_history,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            top_p=self.top_p,
+        )
 
+
+    def _parse_response(self, response):
         text ="?"
+        if response and response.choices:
+            choice = response.choices[0].message
+            text = choice.content
+        return {"text": text}
+
+
+    def _call_openai_model(self, session):
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=combined_history,
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                top_p=self.top_p,
-            )
-
-            if response and response.choices:
-                choice = response.choices[0].message
-                text = choice.content
+            response = self.client.chat.completions.create(**self._request_args(session))
+        except openai.OpenAIError as e:
+            print(f"Error: {e}")
+            if self.raise_errors:
+                raise
+            return {"text": FALLBACK_ANSWER, "expressions": [], "action": None}
+        return self._parse_response(response)
+
 
+    async def _acall_openai_model(self, session):
+        try:
+            response = await self.async_client.chat.completions.create(**self._request_args(session))
         except openai.OpenAIError as e:
             print(f"Error: {e}")
-            return {"text": "I'm sorry, there was an issue processing your request.", "expressions": [], "action": None}
-        return {"text": text}
+            if self.raise_errors:
+                raise
+            return {"text": FALLBACK_ANSWER, "expressions": [], "action": None}
+        return self._parse_response(response)
+
+
+    def _history_budget(self, session):
+        """
+        Tokens left for the history. The system prompt counts against `token_limit`, and
+        prompt + reserved answer (`max_tokens`) must fit into the context window of the model.
+        """
+        system_tokens = self._count_tokens(session.system_prompt) if session.system_prompt else 0
+        return min(self.token_limit, self.context_window - self.max_tokens) - system_tokens
+
+
+    def _trim_history(self, session):
+        budget = self._history_budget(session)
+        while self.history_tokens > budget and len(self.history) > 1:
+            removed = self.history.popleft()
+            self.history_tokens -= removed.tokens
+
 
+    def _count_tokens(self, text):
+        return _count_tokens(self.tokenizer, text)
 
-    def _trim_history(self):
-        while self._count_tokens(self.history) > self.token_limit:
-            if len(self.history) > 1:
-                self.history.pop(0)
-            else:
-                break
 
-    def _count_tokens(self, messages):
-        return sum(len(self.tokenizer.encode(message["content"])) for message in messages)
\ No newline at end of file
+@functools.lru_cache(maxsize=256)
+def _count_tokens(tokenizer, text):
+    # cached: the system prompt is the same for every turn and session
+    return len(tokenizer.encode(text)) + TOKENS_PER_MESSAGE
@@ -0,0 +1,317 @@
+import os
+import time
+import json
+import asyncio
+import threading
+from collections import deque
+
+from llm.base import BaseLLM, FALLBACK_ANSWER
+from llm.factory import LLMFactory
+from backends import load_backend
+
+# Backends in order of preference; the history is handed over in the neutral format (see BaseLLM.get_history)
+LLM_FAILOVER = os.getenv("LLM_FAILOVER", "openai,gemini")
+# A duplicate request is started when the first one takes longer than the p95 latency of its backend
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 0.95))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", 3.0))
+# The circuit opens after N consecutive failures and lets a trial request through after the cooldown
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 3))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+
+class LatencyTracker:
+    """Latencies of the most recent requests of one backend."""
+    min_samples = 20
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p):
+        """None until there are enough samples for a meaningful value."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class CircuitBreaker:
+    def __init__(self, name, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # half open: one trial request per cooldown period
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"Circuit of {self.name} closed again")
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures and self.opened_at is None:
+                print(f"Circuit of {self.name} opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+class BackendHealth:
+    """Process-wide latency and circuit state per backend, shared by all sessions."""
+    _lock = threading.Lock()
+    _backends = {}
+
+    def __init__(self, name):
+        self.latency = LatencyTracker()
+        self.first_delta = LatencyTracker()
+        self.breaker = CircuitBreaker(name)
+
+    @classmethod
+    def of(cls, name):
+        with cls._lock:
+            health = cls._backends.get(name)
+            if health is None:
+                health = cls._backends[name] = cls(name)
+            return health
+
+
+class ResilientLLM(BaseLLM):
+    """
+    Wraps several backends (LLM_FAILOVER) behind one history:
+    - a request that is slower than the p95 of its backend is hedged with a second request
+      (on the next backend, or on the same one if only one is configured); the first answer wins
+    - a failed request fails over to the next backend
+    - backends with repeated failures are skipped until their circuit closes again
+    Every attempt runs on its own backend instance which gets the history handed over in the
+    neutral format; the history of the winner is adopted.
+    """
+    def __init__(self, backends=None):
+        super().__init__()
+        self.names = backends or [name.strip() for name in LLM_FAILOVER.split(",") if name.strip()]
+        self.classes = {name: load_backend(LLMFactory.backends, name) for name in self.names}
+        self.stream_drop_phrases = sorted({phrase for cls in self.classes.values() for phrase in cls.stream_drop_phrases})
+        self.stream_stop_markers = sorted({marker for cls in self.classes.values() for marker in cls.stream_stop_markers})
+        self.history = []
+        # one idle instance per backend, reused for the next turn
+        self.idle = {}
+
+
+    def dump(self):
+        print(json.dumps(self.history, indent=4))
+
+
+    def reset(self, session):
+        self.history = []
+
+
+    def system(self, system_instruction):
+        if system_instruction:
+            self.history.append({"role": "system", "content": system_instruction})
+
+
+    def cache_id(self):
+        # the models are attributes of the backend instances; the instances are kept for the next turn
+        ids = []
+        for name in self.names:
+            if name not in self.idle:
+                self.idle[name] = self.classes[name]()
+            ids.append(self.idle[name].cache_id())
+        return (type(self).__name__, tuple(ids))
+
+
+    def get_history(self):
+        return list(self.history)
+
+
+    def set_history(self, history):
+        self.history = list(history)
+
+
+    def chat(self, session, user_input):
+        """Blocking variant (main.py): plain failover in order, no hedging."""
+        error = None
+        for name in self._candidates():
+            instance = self._acquire(name)
+            health = BackendHealth.of(name)
+            start = time.monotonic()
+            try:
+                result = instance.chat(session, user_input)
+            except Exception as e:
+                print(f"{name} failed: {e}")
+                health.breaker.failure()
+                error = e
+                continue
+            health.breaker.success()
+            health.latency.add(time.monotonic() - start)
+            self._adopt(name, instance)
+            return result
+        return self._fallback(error)
+
+
+    async def achat(self, session, user_input):
+        queue = self._attempts()
+        tasks = {}
+
+        def launch():
+            name = queue.pop(0)
+            instance = self._acquire(name)
+            task = asyncio.create_task(self._timed(BackendHealth.of(name).latency, name, instance.achat(session, user_input)))
+            tasks[task] = (name, instance)
+
+        launch()
+        first_name = next(iter(tasks.values()))[0]
+        hedged = False
+        error = None
+        try:
+            while tasks:
+                timeout = self._hedge_delay(BackendHealth.of(first_name).latency) if queue and not hedged else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    print(f"{first_name} is slow; hedging with {queue[0]}")
+                    launch()
+                    continue
+                for task in done:
+                    name, instance = tasks.pop(task)
+                    if task.exception() is None:
+                        self._adopt(name, instance)
+                        return task.result()
+                    print(f"{name} failed: {task.exception()}")
+                    error = task.exception()
+                if not tasks and queue:
+                    launch()
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self._fallback(error)
+
+
+    async def astream(self, session, user_input):
+        """Hedging and failover apply until the first delta; after that the stream stays with its backend."""
+        queue = self._attempts()
+        pending = {}
+
+        def launch():
+            name = queue.pop(0)
+            instance = self._acquire(name)
+            stream = instance.astream(session, user_input)
+            task = asyncio.create_task(self._timed(BackendHealth.of(name).first_delta, name, stream.__anext__()))
+            pending[task] = (name, instance, stream)
+
+        launch()
+        first_name = next(iter(pending.values()))[0]
+        hedged = False
+        winner = None
+        error = None
+        try:
+            while pending and winner is None:
+                timeout = self._hedge_delay(BackendHealth.of(first_name).first_delta) if queue and not hedged else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    print(f"{first_name} is slow; hedging with {queue[0]}")
+                    launch()
+                    continue
+                for task in done:
+                    name, instance, stream = pending.pop(task)
+                    if winner is None and (task.exception() is None or isinstance(task.exception(), StopAsyncIteration)):
+                        winner = (name, instance, stream, task)
+                    elif winner is None:
+                        print(f"{name} failed: {task.exception()}")
+                        error = task.exception()
+                if winner is None and not pending and queue:
+                    launch()
+        finally:
+            for task, (name, instance, stream) in pending.items():
+                task.cancel()
+
+        if winner is None:
+            yield self._fallback(error)["text"]
+            return
+
+        name, instance, stream, task = winner
+        if isinstance(task.exception(), StopAsyncIteration):
+            self._adopt(name, instance)
+            return
+        yield task.result()
+        try:
+            async for delta in stream:
+                yield delta
+        except Exception as e:
+            # too late for a failover; the partial answer stands, the history is not adopted
+            print(f"{name} failed while streaming: {e}")
+            BackendHealth.of(name).breaker.failure()
+            return
+        self._adopt(name, instance)
+
+
+    def _fallback(self, error):
+        """All backends failed: canned answer, or the last error if the caller wants errors."""
+        if self.raise_errors:
+            raise error or RuntimeError("All LLM backends failed")
+        return {"text": FALLBACK_ANSWER, "expressions": [], "action": None}
+
+
+    def _candidates(self):
+        allowed = [name for name in self.names if BackendHealth.of(name).breaker.allow()]
+        # all circuits open: trying is still better than failing right away
+        return allowed or list(self.names)
+
+
+    def _attempts(self):
+        """Backends for the first request, the hedge and the failovers."""
+        candidates = self._candidates()
+        if len(candidates) == 1:
+            # hedge with a duplicate request on the same backend
+            candidates = candidates * 2
+        return candidates
+
+
+    def _hedge_delay(self, tracker):
+        p = tracker.percentile(LLM_HEDGE_PERCENTILE)
+        return LLM_HEDGE_DEFAULT_DELAY if p is None else max(LLM_HEDGE_MIN_DELAY, p)
+
+
+    async def _timed(self, tracker, name, coro):
+        breaker = BackendHealth.of(name).breaker
+        start = time.monotonic()
+        try:
+            result = await coro
+        except (asyncio.CancelledError, StopAsyncIteration):
+            raise
+        except Exception:
+            breaker.failure()
+            raise
+        breaker.success()
+        tracker.add(time.monotonic() - start)
+        return result
+
+
+    def _acquire(self, name):
+        instance = self.idle.pop(name, None) or self.classes[name]()
+        instance.raise_errors = True
+        instance.set_history(self.history)
+        return instance
+
+
+    def _adopt(self, name, instance):
+        self.history = instance.get_history()
+        self.idle[name] = instance
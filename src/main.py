@@ -2,6 +2,7 @@ import os
 import sys 
 import signal
 import json
+import threading
 from dotenv import load_dotenv
 load_dotenv() 
 
@@ -10,6 +11,9 @@ from llm.factory import LLMFactory
 from stt.factory import STTFactory
 from session import Session
 from audio.pyaudio import PyAudioSink
+from segmenter import SentenceSegmenter
+from speculation import SPECULATIVE_CHAT, SpeculationThread
+from compaction import HistoryCompactor
 
 
 stop_requested = False
@@ -32,8 +36,14 @@ def newSession():
 
 if __name__ == '__main__':
 
+    speculator = None
+    busy = threading.Event()
+
     def process_text(session, text):
 
+        if text.lower() in ("debug", "reset") and speculator:
+            speculator.take(session, "")
+
         if text.lower() == "debug":
             session.llm.dump()
             return
@@ -43,17 +53,30 @@ if __name__ == '__main__':
             return
         
         if len(text)>0:
-            response = session.llm.chat(session,text)
-            print(json.dumps(response, indent=4))
+            # answer which was already requested on a partial transcript (SPECULATIVE_CHAT)
+            speculative_text = speculator.take(session, text) if speculator else None
+            if speculative_text is None:
+                HistoryCompactor.apply(session)
+                response = session.llm.chat(session,text)
+                print(json.dumps(response, indent=4))
+                tts_text = response["text"]
+            else:
+                segmenter = SentenceSegmenter(session.llm.stream_drop_phrases, session.llm.stream_stop_markers)
+                tts_text = " ".join(segmenter.feed(speculative_text) + segmenter.flush())
+                print(tts_text)
 
             session.tts.stop(session)
-            tts_text = response["text"]
                 
             session.tts.speak(session, tts_text)
+            HistoryCompactor.schedule(session)
 
 
     session = newSession()
 
+    if SPECULATIVE_CHAT and hasattr(session.stt, "on_partial_transcript"):
+        speculator = SpeculationThread()
+        session.stt.on_partial_transcript = lambda text: None if busy.is_set() else speculator.speculate(session, text)
+
     # Start the game for this new session
     #
     process_text(session, "Erkläre mir in kurzen Worten worum es hier geht und wer du bist")
@@ -62,7 +85,11 @@ if __name__ == '__main__':
         for text in session.stt.start_recording():
             if stop_requested:
                 break
-            process_text(session, text)
+            busy.set()
+            try:
+                process_text(session, text)
+            finally:
+                busy.clear()
     except Exception as e:
         print(f"An error occurred: {e}")
-        stop()
\ No newline at end of file
+        stop()
@@ -0,0 +1,117 @@
+import re
+from typing import List
+
+
+class SentenceSegmenter:
+    """
+    Collects streamed LLM text deltas and emits complete sentences as soon as they are finished.
+
+    The post-processing which is done on the full text in the non-streaming case works incrementally here:
+    - `drop_phrases` are removed from every emitted sentence (e.g. "Was möchtest du als nächstes tun?")
+    - everything after one of the `stop_markers` is discarded (e.g. Gemini's "(Hinweis:" appendix)
+    Tags like <point_left> are kept; the caller strips them with `Estimator.clean_up`.
+    """
+    _boundary = re.compile(r'(?<=[.!?])\s+')
+
+    def __init__(self, drop_phrases: List[str] = None, stop_markers: List[str] = None):
+        self.drop_phrases = drop_phrases or []
+        self.stop_markers = stop_markers or []
+        self.buffer = ""
+        self.stopped = False
+
+
+    def feed(self, delta: str) -> List[str]:
+        """Adds a text delta and returns all sentences completed by it."""
+        if self.stopped or not delta:
+            return []
+        self.buffer += delta
+
+        for marker in self.stop_markers:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                self.buffer = self.buffer[:index]
+                self.stopped = True
+
+        parts = self._boundary.split(self.buffer)
+        # the last part is not terminated yet (or the terminator is not followed by whitespace yet)
+        self.buffer = parts.pop()
+        if self.stopped:
+            parts.append(self.buffer)
+            self.buffer = ""
+        return self._clean(parts)
+
+
+    def flush(self) -> List[str]:
+        """Returns the remaining text at the end of the stream."""
+        rest = self.buffer
+        self.buffer = ""
+        return self._clean([rest])
+
+
+    def _clean(self, sentences: List[str]) -> List[str]:
+        result = []
+        for sentence in sentences:
+            for phrase in self.drop_phrases:
+                sentence = sentence.replace(phrase, "")
+            sentence = sentence.strip()
+            if sentence:
+                result.append(sentence)
+        return result
+
+
+class DeltaFilter:
+    """
+    Cleans streamed text deltas for display while they arrive: tags like <point_left> and the
+    `drop_phrases` are removed and everything after a `stop_marker` is discarded. Text which could
+    be the beginning of a tag, phrase or marker is held back until it is decidable.
+    """
+    _tag = re.compile(r'<[a-z_]+>')
+    _open_tag = re.compile(r'<[a-z_]*$')
+
+    def __init__(self, drop_phrases: List[str] = None, stop_markers: List[str] = None):
+        self.drop_phrases = drop_phrases or []
+        self.stop_markers = stop_markers or []
+        self.buffer = ""
+        self.stopped = False
+
+
+    def feed(self, delta: str) -> str:
+        if self.stopped or not delta:
+            return ""
+        self.buffer += delta
+
+        for marker in self.stop_markers:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                self.buffer = self.buffer[:index]
+                self.stopped = True
+        self.buffer = self._tag.sub('', self.buffer)
+        for phrase in self.drop_phrases:
+            self.buffer = self.buffer.replace(phrase, "")
+
+        if self.stopped:
+            return self.flush()
+
+        hold = self._held_back_length()
+        text = self.buffer[:len(self.buffer) - hold]
+        self.buffer = self.buffer[len(self.buffer) - hold:]
+        return text
+
+
+    def flush(self) -> str:
+        text = self._tag.sub('', self.buffer)
+        self.buffer = ""
+        return text
+
+
+    def _held_back_length(self) -> int:
+        hold = 0
+        match = self._open_tag.search(self.buffer)
+        if match:
+            hold = len(self.buffer) - match.start()
+        for pattern in self.drop_phrases + self.stop_markers:
+            for length in range(min(len(pattern) - 1, len(self.buffer)), hold, -1):
+                if self.buffer.endswith(pattern[:length]):
+                    hold = length
+                    break
+        return hold
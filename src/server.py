@@ -1,5 +1,5 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Response
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 import textwrap
@@ -11,6 +11,7 @@ import mimetypes
 import secrets
 import os
 import json
+import time
 import asyncio
 from dotenv import load_dotenv
 load_dotenv() 
@@ -18,10 +19,21 @@ load_dotenv()
 from tts.factory import TTSEngineFactory
 from llm.factory import LLMFactory
 from stt.factory import STTFactory
-from session import Session as ChatSession
-from websocketmanager import WebSocketManager
+from session import Session as ChatSession, SessionPool
+from websocketmanager import WebSocketManager, AUDIO_SAMPLE_RATE
+from sessionstore import SessionRegistry, MessageRouter, create_session_store, SESSION_SWEEP_INTERVAL, SESSION_TTL
 from audio.websocket import WebSocketSink
+from audio.codecs import negotiate
 from estimator import Estimator
+from clients import ClientRegistry
+from speechmodels import ModelRegistry
+from segmenter import SentenceSegmenter, DeltaFilter
+from turncache import TurnCache
+from speculation import SPECULATIVE_CHAT, speculate, take_speculation
+from compaction import HistoryCompactor
+from tts.cache import audio_cache
+from tts.scheduler import tts_scheduler
+from tts.playback import playback_pool
 
 
 # Definieren Sie den relativen Pfad zur system_prompt-Datei
@@ -44,21 +56,42 @@ else:
     print(f"Warnung: system_prompt-Datei '{SYSTEM_PROMPT_PATH}' nicht gefunden. Standard-System-Prompt wird verwendet.")
 
 
+# Stream the LLM answer sentence by sentence into the TTS instead of waiting for the full completion
+CHAT_STREAMING = os.getenv("CHAT_STREAMING", "true").lower() in ("1", "true", "yes")
+
+# Fixed prompt of the "start" command. Same prompt, same system prompt, empty history => the
+# answer (text and audio) is taken from the turn cache after the first visitor.
+INTRO_PROMPT = "Erkläre dem Spieler in kurzen Worten worum es hier geht und wer du bist"
+turn_cache = TurnCache()
+
+
 app = FastAPI(title="Chat Application", version="1.0.0")
 templates = Jinja2Templates(directory="templates")
 
-session_store: Dict[str, Dict] = {}
+
+def on_session_evicted(session_id, session):
+    print(f"Evicting session {session_id}")
+    session.close()
+    if session.ws_token in WebSocketManager.connections:
+        asyncio.ensure_future(WebSocketManager.disconnect(session.ws_token))
+
+# shared with the other workers if SESSION_STORE=sqlite (uvicorn --workers N)
+shared_store = create_session_store()
+session_store = SessionRegistry(on_evict=on_session_evicted, store=shared_store, factory=lambda: session_factory())
+if shared_store.shared:
+    WebSocketManager.router = MessageRouter(shared_store)
 
 
 class ChatMessage(BaseModel):
     text: str
 
-def session_factory():
-    # Prepare keyword arguments for the Session constructor
+def build_session():
+    # Prepare keyword arguments for the Session constructor. The components are created
+    # lazily on first use; the web UI e.g. never needs the server side STT.
     session_kwargs = {
-        'llm': LLMFactory.create(),
-        'tts': TTSEngineFactory.create(WebSocketSink()),
-        'stt': STTFactory.create(),
+        'llm_factory': LLMFactory.create,
+        'tts_factory': lambda: TTSEngineFactory.create(WebSocketSink()),
+        'stt_factory': STTFactory.create,
     }
     # Add system_prompt if available
     if system_prompt is not None:
@@ -66,27 +99,64 @@ def session_factory():
     return ChatSession(**session_kwargs)
 
 
+# optional pool of pre-built sessions for bursty arrivals
+session_pool = SessionPool(build_session, size=int(os.getenv("SESSION_POOL_SIZE", 0)))
+
+
+def session_factory():
+    return session_pool.get()
+
+
 # Middleware to retrieve or create a session
-def get_session(request: Request, response: Response) -> Dict:
+async def get_session(request: Request, response: Response) -> Dict:
     session_id = request.cookies.get("session_id")
     print(f"Current session_id (get_session): {session_id}")
 
-    if session_id and session_id in session_store:
-        return session_store[session_id], session_id
+    if session_id:
+        session = await session_store.aget(session_id)
+        if session is not None:
+            return session, session_id
 
     if session_id is None:
         session_id = str(uuid4())
     
-    session_store[session_id] = session_factory()
+    session = session_factory()
+    session_store.put(session_id, session)
     response.set_cookie("session_id", session_id, httponly=True)
-    return session_store[session_id], session_id
+    return session, session_id
 
 
-def get_session_by_token(token):
-    for session_id, session in session_store.items():
-        if session.ws_token == token:
-            return session, session_id
-    return None, None
+async def get_session_by_token(token):
+    return await session_store.aget_by_token(token)
+
+
+async def sweep_sessions():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        evicted = session_store.evict_expired()
+        if evicted:
+            print(f"Evicted {len(evicted)} idle sessions, {len(session_store)} remaining")
+        await asyncio.to_thread(shared_store.purge, SESSION_TTL)
+
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    asyncio.create_task(sweep_sessions())
+    session_pool.refill()
+    if WebSocketManager.router is not None:
+        asyncio.create_task(WebSocketManager.router.relay(WebSocketManager.deliver, on_turn_control))
+
+
+@app.on_event("startup")
+async def warm_up_clients():
+    # open the provider connections before the first visitor arrives
+    asyncio.create_task(ClientRegistry.keep_warm())
+
+
+@app.on_event("startup")
+async def preload_models():
+    # local models (Piper) are loaded once per process, before the first session needs them
+    asyncio.create_task(asyncio.to_thread(ModelRegistry.preload))
 
 
 async def send_tag_message_after_delay(token: str, tag_content: str, delay_in_seconds: float):
@@ -99,6 +169,261 @@ async def send_tag_message_after_delay(token: str, tag_content: str, delay_in_se
         pass
 
 
+class TagScheduler:
+    """
+    Schedules the tag events of a streamed answer relative to the start of the audio playback.
+    Sentences arrive while the audio may already be playing, so later tags are scheduled with
+    the already elapsed playback time subtracted. Tags of a turn which has been replaced by a
+    newer one are not scheduled anymore.
+    """
+    def __init__(self, session, token, turn_id):
+        self.session = session
+        self.token = token
+        self.turn_id = turn_id
+        self.started_at = None
+        self.pending = []
+        self.spoken_characters = 0
+
+    def add(self, sentence):
+        """Registers the tags of the next sentence and returns them as (tag, estimated_duration) tuples."""
+        tag_durations = Estimator.estimate_tag_locations(sentence, self.spoken_characters)
+        self.spoken_characters += len(Estimator.clean_up(sentence)) + 1
+        if self.started_at is None:
+            self.pending.extend(tag_durations)
+        else:
+            self._schedule(tag_durations)
+        return tag_durations
+
+    def on_tts_start(self, session):
+        self.started_at = time.monotonic()
+        self._schedule(self.pending)
+        self.pending = []
+
+    def _schedule(self, tag_durations):
+        if self.session.turn_id != self.turn_id:
+            return
+        elapsed = time.monotonic() - self.started_at
+        for tag_content, estimated_duration in tag_durations:
+            task = asyncio.create_task(send_tag_message_after_delay(self.token, tag_content, max(0.0, estimated_duration - elapsed)))
+            self.session.scheduled_tasks.append(task)
+
+
+def interrupt_playback(session):
+    """Stops everything left from the previous turn: scheduled tags, TTS and audio queued for the websocket."""
+    token = session.ws_token
+    WebSocketManager.send_message(token, json.dumps({"function":"speak.stop"}))
+
+    # Cancel existing scheduled tasks
+    for task in session.scheduled_tasks:
+        task.cancel()
+    session.scheduled_tasks.clear()
+    # does not wait for the playback thread; also drops the audio queued for the websocket
+    session.tts.stop(session)
+
+
+async def begin_turn(session, session_id):
+    """
+    Starts a new turn of the session and returns its id. With several workers the turn of the
+    session may still run on another one: it is cancelled there first, and the history reloaded.
+    """
+    router = WebSocketManager.router
+    if router is not None and await router.claim_turn(session_id):
+        await session_store.aget(session_id)
+    return await session.begin_turn()
+
+
+async def on_turn_control(session_id, kind):
+    """Turn control from another worker (see MessageRouter.claim_turn)."""
+    session = session_store.local(session_id)
+    if session is None:
+        return
+    if kind == "turn.cancel":
+        # another worker runs the session's turns from now on
+        await session.begin_turn()
+        await take_speculation(session, None)
+    interrupt_playback(session)
+
+
+def start_llm_task(session, coro, snapshot=None):
+    """
+    Runs the LLM call `coro` of the current turn as the session's turn task. If a newer turn
+    cancels it, the LLM history is rolled back to `snapshot` (default: the state before the call).
+    """
+    if snapshot is None:
+        try:
+            snapshot = session.llm.get_history()
+        except NotImplementedError:
+            pass
+
+    async def run():
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            if snapshot is not None:
+                session.llm.set_history(snapshot)
+            raise
+
+    session.turn_task = asyncio.create_task(run())
+    return session.turn_task
+
+
+async def pump(stream, deltas):
+    try:
+        async for delta in stream:
+            deltas.put_nowait(delta)
+    finally:
+        deltas.put_nowait(None)
+
+
+async def stream_turn(session, session_id, text):
+    """
+    Runs one chat turn in streaming mode: every finished sentence of the LLM answer is handed to
+    the TTS right away, so the audio starts after the first sentence.
+
+    Yields the events of the turn as dicts:
+      {"type": "delta", "text": ...}                 cleaned text as soon as it is generated
+      {"type": "tag", "tag": ..., "delay": ...}      gesture tag and its estimated playback offset
+      {"type": "done", "response": ..., "cancelled": ...}
+                                                     the complete cleaned answer; `cancelled` if a
+                                                     newer turn of the session aborted this one
+    """
+    turn_id = await begin_turn(session, session_id)
+    interrupt_playback(session)
+    token = session.ws_token
+    speculation = await take_speculation(session, text)
+    if speculation is None:
+        HistoryCompactor.apply(session)
+
+    tags = TagScheduler(session, token, turn_id)
+    cache_key = TurnCache.key(session, text) if text == INTRO_PROMPT else None
+    cached = turn_cache.get(cache_key)
+    if cached is not None:
+        async for event in replay_turn(session, session_id, cached, tags):
+            yield event
+        return
+
+    # filled when the LLM is done; stored together with the audio once the playback is complete
+    entry = {}
+    def on_complete(audio):
+        if entry:
+            turn_cache.put(cache_key, dict(entry, audio=audio))
+
+    feed = session.tts.speak_stream(session, on_start=tags.on_tts_start,
+                                    on_complete=on_complete if cache_key is not None else None)
+    segmenter = SentenceSegmenter(drop_phrases=session.llm.stream_drop_phrases,
+                                  stop_markers=session.llm.stream_stop_markers)
+    delta_filter = DeltaFilter(drop_phrases=session.llm.stream_drop_phrases,
+                               stop_markers=session.llm.stream_stop_markers)
+    raw_sentences = []
+    sentences = []
+
+    def on_sentence(sentence):
+        events = [{"type": "tag", "tag": tag_content, "delay": estimated_duration}
+                  for tag_content, estimated_duration in tags.add(sentence)]
+        cleaned_sentence = Estimator.clean_up(sentence)
+        raw_sentences.append(sentence)
+        sentences.append(cleaned_sentence)
+        feed.put(cleaned_sentence)
+        return events
+
+    # the LLM runs in its own task, so a newer turn can abort it without touching this request
+    deltas = asyncio.Queue()
+    if speculation is not None:
+        # the request is already running (or done) since the interim transcript
+        llm_task = start_llm_task(session, pump(speculation.stream(), deltas), snapshot=speculation.snapshot)
+    else:
+        llm_task = start_llm_task(session, pump(session.llm.astream(session, text), deltas))
+    try:
+        while True:
+            delta = await deltas.get()
+            # a newer turn has started: the deltas still queued belong to an aborted answer
+            if delta is None or session.turn_id != turn_id:
+                break
+            display_text = delta_filter.feed(delta)
+            if display_text:
+                yield {"type": "delta", "text": display_text}
+            for sentence in segmenter.feed(delta):
+                for event in on_sentence(sentence):
+                    yield event
+        await asyncio.wait([llm_task])
+        cancelled = llm_task.cancelled() or session.turn_id != turn_id
+        if not cancelled:
+            llm_task.result()
+            display_text = delta_filter.flush()
+            if display_text:
+                yield {"type": "delta", "text": display_text}
+            for sentence in segmenter.flush():
+                for event in on_sentence(sentence):
+                    yield event
+            if cache_key is not None and sentences:
+                entry.update(sentences=raw_sentences, response=" ".join(sentences),
+                             history=session.llm.get_history())
+    finally:
+        # e.g. the client went away: abort the LLM request as well
+        llm_task.cancel()
+        feed.close()
+
+    cleaned_text = " ".join(sentences)
+    if cancelled:
+        print(f"Turn cancelled by a newer one: {cleaned_text}")
+        yield {"type": "done", "response": cleaned_text, "cancelled": True}
+        return
+    await session_store.asave(session_id)
+    HistoryCompactor.schedule(session)
+
+    print("\n------------------------------------------------------------")
+    print(textwrap.fill(cleaned_text, width=60))
+    print("------------------------------------------------------------\n")
+    yield {"type": "done", "response": cleaned_text, "cancelled": False}
+
+
+async def replay_turn(session, session_id, cached, tags):
+    """Replays a cached turn: restores the LLM history and plays the stored audio."""
+    print("Turn cache hit")
+    session.llm.set_history(cached["history"])
+    await session_store.asave(session_id)
+
+    events = []
+    for sentence in cached["sentences"]:
+        events.extend({"type": "tag", "tag": tag_content, "delay": estimated_duration}
+                      for tag_content, estimated_duration in tags.add(sentence))
+    session.tts.play(session, cached["audio"], on_start=tags.on_tts_start)
+
+    yield {"type": "delta", "text": cached["response"]}
+    for event in events:
+        yield event
+    yield {"type": "done", "response": cached["response"], "cancelled": False}
+
+
+async def prepare_turn(request: Request, response: Response, text: str):
+    """
+    Handles the control commands of the chat endpoints. Returns the session, its id and the text which
+    has to be sent to the LLM, or None as text if the command was handled completely.
+    """
+    session, session_id = await get_session(request, response)
+
+    if text.lower() == "debug":
+        session.llm.dump()
+        return session, session_id, None
+     
+    if text.lower() == "reset":
+        # a running turn or speculation would restore or extend the old history afterwards
+        await begin_turn(session, session_id)
+        await take_speculation(session, None)
+        session.llm.reset(session)
+        await session_store.asave(session_id)
+        return session, session_id, None
+    
+    if text.lower() == "start":
+        old_ws_token = session.ws_token
+        session_store.put(session_id, session_factory())
+        session, session_id = await get_session(request, response)
+        await session_store.aset_token(session_id, old_ws_token)
+        text = INTRO_PROMPT
+
+    return session, session_id, text
+
+
 # Mount the static files directory
 app.mount("/assets", StaticFiles(directory="static"), name="assets")
 
@@ -106,7 +431,7 @@ app.mount("/assets", StaticFiles(directory="static"), name="assets")
 # Updated /ui route to require authentication
 @app.get("/ui", response_class=HTMLResponse, name="ui")
 async def ui(request: Request, response: Response):
-    session, session_id = get_session(request, response)
+    session, session_id = await get_session(request, response)
     print(f"Using session with session_id: {request.cookies.get('session_id')} for /ui request")
     return templates.TemplateResponse("index.html", {"request": request, "session": session})
 
@@ -114,39 +439,31 @@ async def ui(request: Request, response: Response):
 # Chat endpoint with cookie-based authentication
 @app.post("/api/chat", name="chat")
 async def chat(request: Request, data: ChatMessage, response: Response):
-    session, session_id = get_session(request, response)
-    text = data.text
-    
-    if text.lower() == "debug":
-        session.llm.dump()
-        return
-     
-    if text.lower() == "reset":
-        session.llm.reset(session)
+    session, session_id, text = await prepare_turn(request, response, data.text)
+    if text is None:
         return
-    
-    if text.lower() == "start":
-        old_ws_token = session.ws_token
-        session_store[session_id] = session_factory()
-        session, session_id = get_session(request, response)
-        session.ws_token = old_ws_token
-        text = "Erkläre dem Spieler in kurzen Worten worum es hier geht und wer du bist"
 
+    if CHAT_STREAMING and len(text) > 0:
+        async for event in stream_turn(session, session_id, text):
+            if event["type"] == "done":
+                return JSONResponse({"response": event["response"], "cancelled": event["cancelled"]})
 
+    turn_id = await begin_turn(session, session_id)
+    # the speculative answer is only used by the streaming path
+    await take_speculation(session, "")
+    HistoryCompactor.apply(session)
     response_text = ""
     if len(text) > 0:
-        response = session.llm.chat(session, text)
-        session.tts.stop(session)
-        response_text = response["text"]
+        llm_task = start_llm_task(session, session.llm.achat(session, text))
+        await asyncio.wait([llm_task])
+        if llm_task.cancelled() or session.turn_id != turn_id:
+            return JSONResponse({"response": "", "cancelled": True})
+        await session_store.asave(session_id)
+        HistoryCompactor.schedule(session)
+        response_text = llm_task.result()["text"]
 
     token = session.ws_token
-    WebSocketManager.send_message(token, json.dumps({"function":"speak.stop"}))
-
-    # Cancel existing scheduled tasks
-    for task in session.scheduled_tasks:
-        task.cancel()
-    session.scheduled_tasks.clear()
-
+    interrupt_playback(session)
 
     cleaned_text = Estimator.clean_up(response_text)
     
@@ -157,6 +474,8 @@ async def chat(request: Request, data: ChatMessage, response: Response):
 
     # Definieren Sie die on_start Callback-Funktion
     def on_tts_start(session):
+        if session.turn_id != turn_id:
+            return
         tag_durations = Estimator.estimate_tag_locations(response_text)
         for tag_content, estimated_duration in tag_durations:
             task = asyncio.create_task(send_tag_message_after_delay(token, tag_content, estimated_duration))
@@ -167,13 +486,58 @@ async def chat(request: Request, data: ChatMessage, response: Response):
     return JSONResponse({"response": cleaned_text})
 
 
+# Streaming variant of the chat endpoint (Server-Sent Events)
+@app.post("/api/chat/stream", name="chat_stream")
+async def chat_stream(request: Request, data: ChatMessage, response: Response):
+    session, session_id, text = await prepare_turn(request, response, data.text)
+
+    async def event_source():
+        if not text:
+            yield "event: done\ndata: {}\n\n".format(json.dumps({"response": ""}))
+            return
+        async for event in stream_turn(session, session_id, text):
+            yield "event: {}\ndata: {}\n\n".format(event["type"], json.dumps(event))
+
+    stream = StreamingResponse(event_source(), media_type="text/event-stream",
+                               headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # a directly returned response does not inherit the session cookie set by get_session
+    for cookie in response.headers.getlist("set-cookie"):
+        stream.headers.append("set-cookie", cookie)
+    return stream
+
+
+# Interim transcript of the speech recognition; starts the LLM before the user has finished (opt-in)
+@app.post("/api/chat/speculate", name="chat_speculate")
+async def chat_speculate(request: Request, data: ChatMessage, response: Response):
+    if not SPECULATIVE_CHAT:
+        return {"enabled": False, "speculating": False}
+    session, session_id = await get_session(request, response)
+    return {"enabled": True, "speculating": await speculate(session, data.text.strip())}
+
+
+# Hit rate of the on-disk TTS cache
+@app.get("/api/tts/cache", name="tts_cache_stats")
+async def tts_cache_stats():
+    return audio_cache.stats()
+
+
+@app.get("/api/tts/scheduler", name="tts_scheduler_stats")
+async def tts_scheduler_stats():
+    return {**tts_scheduler.stats(), "playback": playback_pool.stats()}
+
+
+@app.get("/api/models", name="model_stats")
+async def model_stats():
+    return ModelRegistry.stats()
+
+
 @app.get("/websocket/connect", name="ws_connect")
 async def ws_connect(request: Request, response: Response):
     # Proceed to load the UI if authenticated
-    session, session_id = get_session(request, response)
+    session, session_id = await get_session(request, response)
 
     if not session.ws_token:
-        session.ws_token = str(uuid4())
+        await session_store.aset_token(session_id, str(uuid4()))
 
     print(f"Retrieved or created ws_token: {session.ws_token}")
     return {"token": session.ws_token}
@@ -182,31 +546,31 @@ async def ws_connect(request: Request, response: Response):
 # WebSocket handling
 @app.websocket("/websocket/{token}")
 async def websocket_endpoint(websocket: WebSocket, token: str):
-    await WebSocketManager.connect(websocket, token)
-    try:
-        while True:
-            await WebSocketManager.process_queue(token)
-            
-            #await asyncio.sleep(0.1)
-            
-            # Try to receive a message from the client with a timeout
-            try:
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=0.1)
-                data = json.loads(data)
-                if data["function"] == "speak.stop":
-                    session, session_id = get_session_by_token(token)
-                    if session:
-                        session.tts.stop(session)
-                elif data["function"] == "speak.statistic":
-                    Estimator.statistic(characters=data["characters"], duration= data["duration"])
-
-            except asyncio.TimeoutError:
-                # No data received; continue the loop
-                pass
+    # the browser announces the audio codecs it can decode, e.g. ?codecs=opus,adpcm,ulaw,pcm
+    session, session_id = await get_session_by_token(token)
+    sample_rate = session.tts.sample_rate if session else AUDIO_SAMPLE_RATE
+    encoder = negotiate(websocket.query_params.get("codecs"), sample_rate)
+    await WebSocketManager.connect(websocket, token, encoder)
+
+    async def on_message(data):
+        data = json.loads(data)
+        if data["function"] == "speak.stop":
+            session, session_id = await get_session_by_token(token)
+            if session:
+                session.tts.stop(session)
+                if WebSocketManager.router is not None:
+                    # the answer may be produced by the worker running the session's turns
+                    WebSocketManager.router.stop_turn(session_id)
+        elif data["function"] == "speak.statistic":
+            Estimator.statistic(characters=data["characters"], duration= data["duration"])
 
+    try:
+        # sender and receiver run as separate tasks and are woken only by real traffic
+        await WebSocketManager.serve(token, on_message)
     except WebSocketDisconnect:
         print("WebSocket disconnected")
-        await WebSocketManager.remove(token)
+    finally:
+        await WebSocketManager.remove(token, websocket)
         
 
 if __name__ == "__main__":
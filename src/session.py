@@ -1,10 +1,134 @@
+import queue
+import asyncio
+import threading
 
 
 class Session():
-    def __init__(self, llm, tts, stt, system_prompt="Du bist ein netter, albener Chatbot", ws_token = None):
-        self.llm = llm
-        self.tts= tts
-        self.stt = stt
+    """
+    Chat session. The components can be given directly (llm, tts, stt) or as factories
+    (llm_factory, ...). Components given as factory are created on first access only; e.g. the
+    server never touches `stt`, so no microphone/VAD is opened for browser sessions.
+    """
+    def __init__(self, llm=None, tts=None, stt=None, system_prompt="Du bist ein netter, albener Chatbot", ws_token = None,
+                 llm_factory=None, tts_factory=None, stt_factory=None):
+        self._llm = llm
+        self._tts= tts
+        self._stt = stt
+        self._factories = {"_llm": llm_factory, "_tts": tts_factory, "_stt": stt_factory}
+        self._lock = threading.Lock()
         self.ws_token = ws_token
         self.system_prompt = system_prompt
-        self.scheduled_tasks = [] 
+        self.scheduled_tasks = []
+        # the newest user turn; older turns still running are cancelled by `begin_turn`
+        self.turn_id = 0
+        self.turn_task = None
+        # LLM request started on an interim transcript (see speculation.py)
+        self.speculation = None
+        # summary of the older history which is being created (see compaction.py)
+        self.compaction = None
+
+    def _component(self, name):
+        component = getattr(self, name)
+        if component is None and self._factories[name] is not None:
+            with self._lock:
+                component = getattr(self, name)
+                if component is None:
+                    component = self._factories[name]()
+                    setattr(self, name, component)
+        return component
+
+    @property
+    def llm(self):
+        return self._component("_llm")
+
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+
+    @property
+    def tts(self):
+        return self._component("_tts")
+
+    @tts.setter
+    def tts(self, tts):
+        self._tts = tts
+
+    @property
+    def stt(self):
+        return self._component("_stt")
+
+    @stt.setter
+    def stt(self, stt):
+        self._stt = stt
+
+    async def begin_turn(self):
+        """
+        Starts a new user turn and returns its id. The LLM task of a still running older turn is
+        cancelled and awaited, so it has rolled back its history before the new turn starts.
+        """
+        self.turn_id += 1
+        task, self.turn_task = self.turn_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+        return self.turn_id
+
+    def close(self):
+        """Releases TTS/STT resources. Called when the session is evicted or replaced."""
+        for task in self.scheduled_tasks:
+            task.cancel()
+        self.scheduled_tasks.clear()
+        if self.turn_task is not None:
+            self.turn_task.cancel()
+        if self.speculation is not None:
+            self.speculation.task.cancel()
+        # only close what has actually been created
+        if self._tts is not None:
+            try:
+                self._tts.stop(self)
+                self._tts.audio_sink.close(self)
+            except Exception as e:
+                print(f"Error closing TTS: {e}")
+        if self._stt is not None:
+            try:
+                self._stt.stop()
+            except Exception as e:
+                print(f"Error closing STT: {e}")
+
+
+class SessionPool:
+    """
+    Keeps up to `size` pre-built sessions ready, so a new visitor (or the "start" command) gets a
+    session immediately. The pool is refilled in a background thread. Only the LLM is built in
+    advance; the TTS captures the event loop and is therefore created on first use.
+    """
+    def __init__(self, factory, size=0):
+        self.factory = factory
+        self.size = size
+        self.sessions = queue.Queue()
+        self._refilling = threading.Lock()
+
+    def get(self):
+        try:
+            session = self.sessions.get_nowait()
+        except queue.Empty:
+            session = self.factory()
+        self.refill()
+        return session
+
+    def refill(self):
+        if self.size <= 0 or self.sessions.qsize() >= self.size:
+            return
+        if self._refilling.acquire(blocking=False):
+            threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        try:
+            while self.sessions.qsize() < self.size:
+                session = self.factory()
+                session.llm  # builds the LLM (tokenizer, clients) in advance
+                self.sessions.put(session)
+        except Exception as e:
+            print(f"Error pre-building session: {e}")
+        finally:
+            self._refilling.release()
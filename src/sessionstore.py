@@ -0,0 +1,655 @@
+import os
+import abc
+import json
+import time
+import socket
+import sqlite3
+import queue
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", 3600))              # seconds of inactivity before a session is evicted
+SESSION_MAX = int(os.getenv("SESSION_MAX", 500))                 # max. number of live sessions (LRU eviction)
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", 60))
+
+# "memory" (single worker) or "sqlite" (shared by all workers/processes on the host)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.db")
+ROUTER_POLL_INTERVAL = float(os.getenv("ROUTER_POLL_INTERVAL", 0.02))
+# seconds a worker waits for another worker to cancel the turn of a session it takes over
+TURN_HANDOVER_TIMEOUT = float(os.getenv("TURN_HANDOVER_TIMEOUT", 2.0))
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+
+class BaseSessionStore(abc.ABC):
+    """
+    Serializable session state which has to survive a request landing on another worker:
+    the LLM history of a session, the ws_token -> session_id mapping, the worker which
+    holds the websocket connection of a token and the worker which runs the turns of a
+    session (plus a mailbox per worker for routing).
+    """
+    # True if the store is visible to other processes
+    shared = False
+
+    @abc.abstractmethod
+    def load_history(self, session_id: str) -> Optional[list]:
+        pass
+
+    @abc.abstractmethod
+    def save_history(self, session_id: str, history: list) -> float:
+        """Saves the history and returns its version (save timestamp)."""
+        pass
+
+    @abc.abstractmethod
+    def history_version(self, session_id: str) -> Optional[float]:
+        pass
+
+    @abc.abstractmethod
+    def set_token(self, token: str, session_id: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get_session_id(self, token: str) -> Optional[str]:
+        pass
+
+    @abc.abstractmethod
+    def get_token(self, session_id: str) -> Optional[str]:
+        pass
+
+    @abc.abstractmethod
+    def set_owner(self, token: str, worker_id: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get_owner(self, token: str) -> Optional[str]:
+        pass
+
+    @abc.abstractmethod
+    def clear_owner(self, token: str, worker_id: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def claim_turn(self, session_id: str, worker_id: str) -> Optional[str]:
+        """Makes `worker_id` the worker running the turns of the session; returns the previous one."""
+        pass
+
+    @abc.abstractmethod
+    def get_turn_owner(self, session_id: str) -> Optional[str]:
+        pass
+
+    @abc.abstractmethod
+    def publish(self, worker_id: str, token: str, kind: str, payload) -> None:
+        pass
+
+    @abc.abstractmethod
+    def fetch(self, worker_id: str) -> List[Tuple[str, str, object]]:
+        pass
+
+    @abc.abstractmethod
+    def purge(self, older_than: float) -> None:
+        """Deletes the state of all sessions not saved within the last `older_than` seconds."""
+        pass
+
+
+class MemorySessionStore(BaseSessionStore):
+    """Store for a single worker process. There is nobody to route to, so the mailbox stays empty."""
+    def __init__(self):
+        self.histories: Dict[str, Tuple[float, list]] = {}
+        self.tokens: Dict[str, str] = {}
+        self.owners: Dict[str, str] = {}
+        self.turn_owners: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def load_history(self, session_id):
+        with self.lock:
+            entry = self.histories.get(session_id)
+            return list(entry[1]) if entry else None
+
+    def save_history(self, session_id, history):
+        version = time.time()
+        with self.lock:
+            self.histories[session_id] = (version, list(history))
+        return version
+
+    def history_version(self, session_id):
+        with self.lock:
+            entry = self.histories.get(session_id)
+            return entry[0] if entry else None
+
+    def set_token(self, token, session_id):
+        with self.lock:
+            self.tokens[token] = session_id
+
+    def get_session_id(self, token):
+        with self.lock:
+            return self.tokens.get(token)
+
+    def get_token(self, session_id):
+        with self.lock:
+            tokens = [t for t, sid in self.tokens.items() if sid == session_id]
+            return tokens[-1] if tokens else None
+
+    def set_owner(self, token, worker_id):
+        with self.lock:
+            self.owners[token] = worker_id
+
+    def get_owner(self, token):
+        with self.lock:
+            return self.owners.get(token)
+
+    def clear_owner(self, token, worker_id):
+        with self.lock:
+            if self.owners.get(token) == worker_id:
+                del self.owners[token]
+
+    def claim_turn(self, session_id, worker_id):
+        with self.lock:
+            previous = self.turn_owners.get(session_id)
+            self.turn_owners[session_id] = worker_id
+            return previous
+
+    def get_turn_owner(self, session_id):
+        with self.lock:
+            return self.turn_owners.get(session_id)
+
+    def publish(self, worker_id, token, kind, payload):
+        pass
+
+    def fetch(self, worker_id):
+        return []
+
+    def purge(self, older_than):
+        limit = time.time() - older_than
+        with self.lock:
+            for session_id in [sid for sid, (saved, _) in self.histories.items() if saved < limit]:
+                del self.histories[session_id]
+            alive = set(self.histories)
+            for token in [t for t, sid in self.tokens.items() if sid not in alive]:
+                del self.tokens[token]
+            for session_id in [sid for sid in self.turn_owners if sid not in alive]:
+                del self.turn_owners[session_id]
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """
+    Store in a SQLite file, shared by all uvicorn workers (processes) on the host.
+    WAL mode allows concurrent readers while one worker writes.
+    """
+    shared = True
+
+    def __init__(self, path: str = SESSION_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS histories (session_id TEXT PRIMARY KEY, history TEXT, saved REAL);
+            CREATE TABLE IF NOT EXISTS tokens (token TEXT PRIMARY KEY, session_id TEXT);
+            CREATE TABLE IF NOT EXISTS owners (token TEXT PRIMARY KEY, worker_id TEXT);
+            CREATE TABLE IF NOT EXISTS turn_owners (session_id TEXT PRIMARY KEY, worker_id TEXT);
+            CREATE TABLE IF NOT EXISTS mailbox (id INTEGER PRIMARY KEY AUTOINCREMENT, worker_id TEXT, token TEXT, kind TEXT, payload BLOB);
+            CREATE INDEX IF NOT EXISTS mailbox_worker ON mailbox (worker_id, id);
+        """)
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def load_history(self, session_id):
+        rows = self._query("SELECT history FROM histories WHERE session_id = ?", (session_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def save_history(self, session_id, history):
+        version = time.time()
+        self._query("INSERT OR REPLACE INTO histories VALUES (?, ?, ?)", (session_id, json.dumps(history), version))
+        return version
+
+    def history_version(self, session_id):
+        rows = self._query("SELECT saved FROM histories WHERE session_id = ?", (session_id,))
+        return rows[0][0] if rows else None
+
+    def set_token(self, token, session_id):
+        self._query("INSERT OR REPLACE INTO tokens VALUES (?, ?)", (token, session_id))
+
+    def get_session_id(self, token):
+        rows = self._query("SELECT session_id FROM tokens WHERE token = ?", (token,))
+        return rows[0][0] if rows else None
+
+    def get_token(self, session_id):
+        rows = self._query("SELECT token FROM tokens WHERE session_id = ? ORDER BY rowid DESC LIMIT 1", (session_id,))
+        return rows[0][0] if rows else None
+
+    def set_owner(self, token, worker_id):
+        self._query("INSERT OR REPLACE INTO owners VALUES (?, ?)", (token, worker_id))
+
+    def get_owner(self, token):
+        rows = self._query("SELECT worker_id FROM owners WHERE token = ?", (token,))
+        return rows[0][0] if rows else None
+
+    def clear_owner(self, token, worker_id):
+        self._query("DELETE FROM owners WHERE token = ? AND worker_id = ?", (token, worker_id))
+
+    def claim_turn(self, session_id, worker_id):
+        with self.lock:
+            # read and replace in one write transaction: two workers taking over at once see each other
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.db.execute("SELECT worker_id FROM turn_owners WHERE session_id = ?", (session_id,)).fetchall()
+                self.db.execute("INSERT OR REPLACE INTO turn_owners VALUES (?, ?)", (session_id, worker_id))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return rows[0][0] if rows else None
+
+    def get_turn_owner(self, session_id):
+        rows = self._query("SELECT worker_id FROM turn_owners WHERE session_id = ?", (session_id,))
+        return rows[0][0] if rows else None
+
+    def publish(self, worker_id, token, kind, payload):
+        self._query("INSERT INTO mailbox (worker_id, token, kind, payload) VALUES (?, ?, ?, ?)",
+                    (worker_id, token, kind, payload))
+
+    def fetch(self, worker_id):
+        # only the owner deletes from its mailbox, so read + delete needs no write transaction
+        rows = self._query("SELECT id, token, kind, payload FROM mailbox WHERE worker_id = ? ORDER BY id", (worker_id,))
+        if rows:
+            self._query("DELETE FROM mailbox WHERE worker_id = ? AND id <= ?", (worker_id, rows[-1][0]))
+        return [(token, kind, payload) for _, token, kind, payload in rows]
+
+    def purge(self, older_than):
+        limit = time.time() - older_than
+        self._query("DELETE FROM histories WHERE saved < ?", (limit,))
+        self._query("DELETE FROM tokens WHERE session_id NOT IN (SELECT session_id FROM histories)")
+        self._query("DELETE FROM turn_owners WHERE session_id NOT IN (SELECT session_id FROM histories)")
+
+
+def create_session_store(name: str = SESSION_STORE) -> BaseSessionStore:
+    if name == "sqlite":
+        return SQLiteSessionStore()
+    if name == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown session store '{name}'. Available: memory, sqlite")
+
+
+class MessageRouter:
+    """
+    Delivers websocket messages for tokens whose connection is held by another worker.
+    Every worker claims the tokens of its connections in the store; messages for foreign
+    tokens are put into the owner's mailbox, which the owner drains in `relay`.
+    The writes go through one writer thread in order, so callers on the event loop never
+    wait for the database.
+
+    Turn control goes the same way: the worker which starts a turn of a session claims it
+    (`claim_turn`); a turn still running on the previous worker is cancelled there, and a
+    barge-in stops the playback on the worker which produces it (`stop_turn`).
+    """
+    def __init__(self, store: BaseSessionStore, worker_id: str = WORKER_ID, poll_interval: float = ROUTER_POLL_INTERVAL):
+        self.store = store
+        self.worker_id = worker_id
+        self.poll_interval = poll_interval
+        self.owner_cache: Dict[str, Tuple[float, Optional[str]]] = {}
+        # session_id -> future of a `claim_turn` waiting for the previous worker
+        self.handovers: Dict[str, asyncio.Future] = {}
+        self.outbox = queue.Queue()
+        threading.Thread(target=self._write, daemon=True, name="router-writer").start()
+
+    def claim(self, token: str) -> None:
+        self.outbox.put((self.store.set_owner, (token, self.worker_id)))
+
+    def release(self, token: str) -> None:
+        self.outbox.put((self.store.clear_owner, (token, self.worker_id)))
+
+    def forward(self, token: str, kind: str, payload) -> None:
+        if isinstance(payload, memoryview):
+            # only valid during the sink's write (cached audio); the writer thread stores it later
+            payload = bytes(payload)
+        self.outbox.put((self._publish, (token, kind, payload)))
+
+    async def claim_turn(self, session_id: str, timeout: float = TURN_HANDOVER_TIMEOUT) -> bool:
+        """
+        Makes this worker the one running the turns of the session. If another worker ran the
+        previous turn, it is asked to cancel it and stop its audio, and this call waits until it
+        has (at most `timeout` seconds). Returns True in that case: the stored history has to be
+        reloaded, the other worker may have saved its last turn in the meantime.
+        """
+        previous = await asyncio.to_thread(self.store.claim_turn, session_id, self.worker_id)
+        if previous is None or previous == self.worker_id:
+            return False
+        handover = self.handovers[session_id] = asyncio.get_running_loop().create_future()
+        self.outbox.put((self.store.publish, (previous, session_id, "turn.cancel", self.worker_id)))
+        try:
+            await asyncio.wait_for(handover, timeout)
+        except asyncio.TimeoutError:
+            print(f"Worker {previous} did not hand over session {session_id}")
+        finally:
+            if self.handovers.get(session_id) is handover:
+                del self.handovers[session_id]
+        return True
+
+    def stop_turn(self, session_id: str) -> None:
+        """Stops the playback of the session on the worker running its turns, if that is another one."""
+        self.outbox.put((self._publish_stop, (session_id,)))
+
+    def _publish_stop(self, session_id: str) -> None:
+        owner = self.store.get_turn_owner(session_id)
+        if owner and owner != self.worker_id:
+            self.store.publish(owner, session_id, "turn.stop", self.worker_id)
+
+    def _write(self) -> None:
+        while True:
+            call, args = self.outbox.get()
+            try:
+                call(*args)
+            except Exception as e:
+                print(f"Message router: {e}")
+
+    def _publish(self, token: str, kind: str, payload) -> None:
+        now = time.monotonic()
+        cached = self.owner_cache.get(token)
+        if cached is None or now - cached[0] > 1.0:
+            cached = (now, self.store.get_owner(token))
+            self.owner_cache[token] = cached
+        owner = cached[1]
+        if owner and owner != self.worker_id:
+            self.store.publish(owner, token, kind, payload)
+
+    async def relay(self, deliver: Callable[[str, str, object], None],
+                    control: Optional[Callable[[str, str], Awaitable[None]]] = None) -> None:
+        """
+        Drains this worker's mailbox and hands every message to `deliver(token, kind, payload)`.
+        Turn control is handled on the event loop: `control(session_id, kind)` cancels the turn
+        ("turn.cancel") or stops the playback ("turn.stop") of a session of this worker.
+        """
+        while True:
+            messages = await asyncio.to_thread(self.store.fetch, self.worker_id)
+            if not messages:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            websocket_messages = []
+            for token, kind, payload in messages:
+                if not kind.startswith("turn."):
+                    websocket_messages.append((token, kind, payload))
+                    continue
+                try:
+                    await self._control(token, kind, payload, control)
+                except Exception as e:
+                    print(f"Message router: {e}")
+            if websocket_messages:
+                # delivery of audio may block on backpressure, so it runs in a worker thread
+                await asyncio.to_thread(lambda: [deliver(*message) for message in websocket_messages])
+
+    async def _control(self, session_id: str, kind: str, sender: str, control) -> None:
+        if kind == "turn.cancelled":
+            handover = self.handovers.get(session_id)
+            if handover is not None and not handover.done():
+                handover.set_result(sender)
+            return
+        if control is not None:
+            await control(session_id, kind)
+        if kind == "turn.cancel":
+            self.outbox.put((self.store.publish, (sender, session_id, "turn.cancelled", self.worker_id)))
+
+
+class SessionRegistry:
+    """
+    Holds the live chat sessions of the server.
+
+    - session_id -> session in LRU order (most recently used last)
+    - ws_token   -> session_id index, so a websocket message finds its session in O(1)
+    - idle-TTL and max-count eviction. Evicted sessions are handed to `on_evict`, which
+      is responsible for releasing their resources.
+    - write-through of the LLM history and token mapping to a `BaseSessionStore`, so that
+      another worker can take over a session.
+    """
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX,
+                 on_evict: Optional[Callable[[str, object], None]] = None,
+                 store: Optional[BaseSessionStore] = None, factory: Optional[Callable[[], object]] = None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict or (lambda session_id, session: session.close())
+        # shared state; a session unknown to this worker is rebuilt with `factory` from the stored history
+        self.store = store or MemorySessionStore()
+        self.factory = factory
+        self.sessions: "OrderedDict[str, object]" = OrderedDict()
+        self.versions: Dict[str, float] = {}       # version of the stored history the local session is based on
+        self.last_activity: Dict[str, float] = {}
+        self.tokens: Dict[str, str] = {}
+        self.lock = threading.RLock()
+
+
+    def __contains__(self, session_id) -> bool:
+        with self.lock:
+            return session_id in self.sessions
+
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.sessions)
+
+
+    def get(self, session_id: str):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self._touch(session_id)
+        if session is None:
+            return self._restore(session_id)
+        if self.store.shared:
+            self._refresh(session_id, session)
+        return session
+
+
+    async def aget(self, session_id: str):
+        """`get` for the event loop: the queries of a shared store run in a worker thread."""
+        if not self.store.shared:
+            return self.get(session_id)
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self._touch(session_id)
+        if session is None:
+            if self.factory is None:
+                return None
+            stored = await asyncio.to_thread(self._load, session_id)
+            return self._build(session_id, stored) if stored is not None else None
+        stale = await asyncio.to_thread(self._stale_history, session_id)
+        if stale is not None:
+            self._apply(session_id, session, stale)
+        return session
+
+
+    def save(self, session_id: str) -> None:
+        """Writes the LLM history of the session through to the store. Call after every turn."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is not None:
+            self.versions[session_id] = self.store.save_history(session_id, session.llm.get_history())
+
+
+    async def asave(self, session_id: str) -> None:
+        """`save` for the event loop: the history is taken right away, the write runs in a worker thread."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is not None:
+            history = session.llm.get_history()
+            self.versions[session_id] = await self._blocking(self.store.save_history, session_id, history)
+
+
+    def put(self, session_id: str, session) -> None:
+        """Adds or replaces a session. A replaced session is closed, its ws_token is kept in the index."""
+        with self.lock:
+            old = self.sessions.get(session_id)
+            self.sessions[session_id] = session
+            self._touch(session_id)
+            if session.ws_token:
+                self.tokens[session.ws_token] = session_id
+            evicted = self._evict_overflow()
+        if old is not None and old is not session:
+            old.close()
+        for entry in evicted:
+            self.on_evict(*entry)
+
+
+    def set_token(self, session_id: str, token: str) -> None:
+        if self._set_local_token(session_id, token) and token:
+            self.store.set_token(token, session_id)
+
+
+    async def aset_token(self, session_id: str, token: str) -> None:
+        if self._set_local_token(session_id, token) and token:
+            await self._blocking(self.store.set_token, token, session_id)
+
+
+    def get_by_token(self, token: str) -> Tuple[object, Optional[str]]:
+        with self.lock:
+            session_id = self.tokens.get(token)
+            if session_id is not None and session_id in self.sessions:
+                self._touch(session_id)
+                return self.sessions[session_id], session_id
+        session_id = self.store.get_session_id(token)
+        if session_id is None:
+            return None, None
+        session = self.get(session_id)
+        return (session, session_id) if session is not None else (None, None)
+
+
+    async def aget_by_token(self, token: str) -> Tuple[object, Optional[str]]:
+        with self.lock:
+            session_id = self.tokens.get(token)
+            if session_id is not None and session_id in self.sessions:
+                self._touch(session_id)
+                return self.sessions[session_id], session_id
+        session_id = await self._blocking(self.store.get_session_id, token)
+        if session_id is None:
+            return None, None
+        session = await self.aget(session_id)
+        return (session, session_id) if session is not None else (None, None)
+
+
+    def local(self, session_id: str):
+        """The session if it lives in this worker; never restored from the store."""
+        with self.lock:
+            return self.sessions.get(session_id)
+
+
+    def remove(self, session_id: str) -> None:
+        with self.lock:
+            entry = self._pop(session_id)
+        if entry:
+            self.on_evict(*entry)
+
+
+    def evict_expired(self) -> List[str]:
+        """Evicts all sessions idle for longer than the TTL. Returns the evicted session ids."""
+        now = time.monotonic()
+        evicted = []
+        with self.lock:
+            # sessions are kept in LRU order; stop at the first one that is still fresh
+            for session_id in list(self.sessions.keys()):
+                if now - self.last_activity[session_id] < self.ttl:
+                    break
+                evicted.append(self._pop(session_id))
+        for entry in evicted:
+            self.on_evict(*entry)
+        return [session_id for session_id, _ in evicted]
+
+
+    def _restore(self, session_id: str):
+        """Rebuilds a session another worker has created (only with a shared store)."""
+        if not self.store.shared or self.factory is None:
+            return None
+        stored = self._load(session_id)
+        return self._build(session_id, stored) if stored is not None else None
+
+
+    def _load(self, session_id: str):
+        """Stored (history, token, version) of a session or None. Blocking."""
+        history = self.store.load_history(session_id)
+        if history is None:
+            return None
+        return history, self.store.get_token(session_id), self.store.history_version(session_id)
+
+
+    def _build(self, session_id: str, stored):
+        with self.lock:
+            # restored concurrently by another request while the store was queried
+            session = self.sessions.get(session_id)
+            if session is not None:
+                return session
+        history, token, version = stored
+        session = self.factory()
+        session.llm.set_history(history)
+        session.ws_token = token
+        self.put(session_id, session)
+        self.versions[session_id] = version
+        return session
+
+
+    def _refresh(self, session_id: str, session) -> None:
+        """Reloads the history if another worker has continued the conversation in the meantime."""
+        stale = self._stale_history(session_id)
+        if stale is not None:
+            self._apply(session_id, session, stale)
+
+
+    def _stale_history(self, session_id: str):
+        """(history, version) if the stored history is newer than the local one, else None. Blocking."""
+        version = self.store.history_version(session_id)
+        if version is None or version == self.versions.get(session_id):
+            return None
+        return self.store.load_history(session_id), version
+
+
+    def _apply(self, session_id: str, session, stale) -> None:
+        history, version = stale
+        session.llm.set_history(history)
+        self.versions[session_id] = version
+
+
+    def _set_local_token(self, session_id: str, token: str) -> bool:
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return False
+            if session.ws_token and self.tokens.get(session.ws_token) == session_id:
+                del self.tokens[session.ws_token]
+            session.ws_token = token
+            if token:
+                self.tokens[token] = session_id
+        return True
+
+
+    async def _blocking(self, call, *args):
+        """Runs a store call; in a worker thread if it is a database query (shared store)."""
+        if self.store.shared:
+            return await asyncio.to_thread(call, *args)
+        return call(*args)
+
+
+    def _touch(self, session_id: str) -> None:
+        self.last_activity[session_id] = time.monotonic()
+        self.sessions.move_to_end(session_id)
+
+
+    def _evict_overflow(self):
+        evicted = []
+        while len(self.sessions) > self.max_sessions:
+            oldest = next(iter(self.sessions))
+            evicted.append(self._pop(oldest))
+        return evicted
+
+
+    def _pop(self, session_id: str):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return None
+        self.last_activity.pop(session_id, None)
+        self.versions.pop(session_id, None)
+        if session.ws_token and self.tokens.get(session.ws_token) == session_id:
+            del self.tokens[session.ws_token]
+        return session_id, session
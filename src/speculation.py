@@ -0,0 +1,131 @@
+import os
+import re
+import asyncio
+import difflib
+import threading
+
+# Opt-in: start the LLM on a stable interim transcript before the user has finished speaking
+SPECULATIVE_CHAT = os.getenv("SPECULATIVE_CHAT", "false").lower() in ("1", "true", "yes")
+# How similar the final transcript has to be to the speculated one (0..1) to keep the result
+SPECULATION_MIN_SIMILARITY = float(os.getenv("SPECULATION_MIN_SIMILARITY", 0.9))
+
+
+def normalize(text):
+    return " ".join(re.sub(r"[^\w\s]", "", text.lower()).split())
+
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, normalize(a), normalize(b)).ratio()
+
+
+class Speculation:
+    """
+    LLM request started on an interim transcript. The deltas are buffered until the final
+    transcript arrives; then the turn either adopts the request (`stream`) or drops it (`cancel`).
+    Must be created on the running event loop.
+    """
+    def __init__(self, session, text):
+        self.text = text
+        self.deltas = []
+        self.finished = False
+        self.changed = asyncio.Event()
+        try:
+            self.snapshot = session.llm.get_history()
+        except NotImplementedError:
+            self.snapshot = None
+        self.llm = session.llm
+        self.task = asyncio.create_task(self._run(session))
+
+
+    async def _run(self, session):
+        try:
+            async for delta in self.llm.astream(session, self.text):
+                self.deltas.append(delta)
+                self.changed.set()
+        finally:
+            self.finished = True
+            self.changed.set()
+
+
+    def matches(self, text):
+        return similarity(self.text, text) >= SPECULATION_MIN_SIMILARITY
+
+
+    async def stream(self):
+        """Yields all deltas: first the buffered ones, then the rest as it arrives."""
+        index = 0
+        try:
+            while True:
+                while index < len(self.deltas):
+                    yield self.deltas[index]
+                    index += 1
+                if self.finished:
+                    break
+                self.changed.clear()
+                if index == len(self.deltas) and not self.finished:
+                    await self.changed.wait()
+        finally:
+            # the adopting turn was aborted; stop the request as well
+            if not self.finished:
+                self.task.cancel()
+        if not self.task.cancelled():
+            self.task.result()
+
+
+    async def cancel(self):
+        """Aborts the request and removes its traces from the LLM history."""
+        self.task.cancel()
+        await asyncio.wait([self.task])
+        if self.snapshot is not None:
+            self.llm.set_history(self.snapshot)
+
+
+async def speculate(session, text):
+    """
+    Starts a speculation for the interim transcript `text` (or keeps the running one if the text
+    did not change). Returns False if no speculation is running, e.g. because a turn is in flight.
+    """
+    if not text or (session.turn_task is not None and not session.turn_task.done()):
+        return False
+    current = session.speculation
+    if current is not None:
+        if normalize(current.text) == normalize(text):
+            return True
+        session.speculation = None
+        await current.cancel()
+    session.speculation = Speculation(session, text)
+    return True
+
+
+async def take_speculation(session, text):
+    """Returns the session's speculation if it matches the final transcript `text`; drops it otherwise."""
+    speculation, session.speculation = session.speculation, None
+    if speculation is None:
+        return None
+    if text and speculation.matches(text):
+        print(f"Speculation hit: '{speculation.text}' ~ '{text}'")
+        return speculation
+    print(f"Speculation miss: '{speculation.text}' != '{text}'")
+    await speculation.cancel()
+    return None
+
+
+class SpeculationThread:
+    """Runs speculations for synchronous callers (main.py) on a private event loop."""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+
+    def speculate(self, session, text):
+        asyncio.run_coroutine_threadsafe(speculate(session, text), self.loop)
+
+
+    def take(self, session, text):
+        """Blocks until the speculative answer for the final `text` is complete; None if there is none."""
+        async def collect():
+            speculation = await take_speculation(session, text)
+            if speculation is None:
+                return None
+            return "".join([delta async for delta in speculation.stream()])
+        return asyncio.run_coroutine_threadsafe(collect(), self.loop).result()
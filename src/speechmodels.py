@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+
+
+def _rss_bytes():
+    """Resident memory of this process; None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SharedModel:
+    """
+    A local model shared by all sessions. The model objects (Piper, RealtimeSTT) are not safe for
+    concurrent use, so every inference has to hold `lock` or run in a single thread.
+    """
+    def __init__(self, name, model, load_seconds, memory_bytes):
+        self.name = name
+        self.model = model
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.lock = threading.Lock()
+        self.uses = 0
+
+
+    def iterate(self, generator):
+        """
+        Runs a streaming inference step by step under the lock. Between the steps (e.g. the
+        sentences of a Piper synthesis) other sessions get their turn.
+        """
+        try:
+            while True:
+                with self.lock:
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            generator.close()
+
+
+class ModelRegistry:
+    """
+    Process-wide local speech models (Piper voices, Whisper). Each model is loaded once, on first
+    use, and shared by all sessions; the libraries are imported only when a model is requested.
+    """
+    _lock = threading.Lock()
+    _models = {}
+
+
+    @classmethod
+    def _get(cls, key, name, loader):
+        shared = cls._models.get(key)
+        if shared is None:
+            # one load at a time, which also keeps the measured memory per model meaningful
+            with cls._lock:
+                shared = cls._models.get(key)
+                if shared is None:
+                    print(f"Loading {name} ...")
+                    rss_before = _rss_bytes()
+                    start = time.monotonic()
+                    model = loader()
+                    rss_after = _rss_bytes()
+                    memory = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+                    shared = SharedModel(name, model, time.monotonic() - start, memory)
+                    cls._models[key] = shared
+                    print(f"Loaded {name} in {shared.load_seconds:.1f}s")
+        shared.uses += 1
+        return shared
+
+
+    @classmethod
+    def piper_voice(cls, model_path):
+        def loader():
+            from piper.voice import PiperVoice
+            return PiperVoice.load(model_path)
+        return cls._get(("piper", model_path), f"Piper voice {os.path.basename(model_path)}", loader)
+
+
+    @classmethod
+    def whisper_recorder(cls, language, model):
+        """
+        RealtimeSTT recorder, which holds the Whisper model and listens to the local microphone.
+        It is used by one listener thread only (see stt/whisper_local.py).
+        """
+        def loader():
+            from RealtimeSTT import AudioToTextRecorder
+            return AudioToTextRecorder(language=language, model=model, print_transcription_time=True)
+        return cls._get(("whisper", language, model), f"Whisper {model} ({language})", loader)
+
+
+    @classmethod
+    def preload(cls):
+        """Loads the models of the configured local backends before the first session needs them."""
+        if os.getenv("TTS_BACKEND") == "piper":
+            from tts.piper import PiperTTS
+            cls.piper_voice(PiperTTS.voice_path)
+
+
+    @classmethod
+    def stats(cls):
+        return {
+            "rss_bytes": _rss_bytes(),
+            "models": [
+                {
+                    "name": shared.name,
+                    "load_seconds": round(shared.load_seconds, 3),
+                    # growth of this process while loading; None if unknown
+                    "memory_bytes": shared.memory_bytes,
+                    "uses": shared.uses,
+                }
+                for shared in list(cls._models.values())
+            ],
+        }
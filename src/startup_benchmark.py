@@ -0,0 +1,105 @@
+"""
+Measures the cold start of the chatbot: import time of `server.py` / `main.py` and the time
+until the first request (server: GET /ui, which creates a session; main: creation of the first
+session). Every run happens in a fresh interpreter, so module caches do not distort the numbers.
+
+    python src/startup_benchmark.py                      # 5 runs per target
+    python src/startup_benchmark.py --runs 10 --output startup.jsonl
+
+With --output the results are appended as one JSON line per invocation, so the cold start
+can be tracked over time (e.g. in CI or in the container).
+The backends are selected as usual with LLM_BACKEND, TTS_BACKEND and STT_BACKEND.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+
+# executed in a fresh interpreter; prints one JSON line with the measured times
+_PROBES = {
+    "server": """
+import json, time
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(server.app)
+response = client.get("/ui")
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_request": done - imported, "status": response.status_code}))
+""",
+    "main": """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+session = main.newSession()
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_request": done - imported, "status": 200}))
+""",
+}
+
+
+def run_probe(target):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    result = subprocess.run([sys.executable, "-c", _PROBES[target]], cwd=ROOT_DIR, env=env,
+                            capture_output=True, text=True)
+    # the application prints a lot; the measurement is the last line
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {"error": (result.stderr.strip().splitlines() or ["unknown error"])[-1]}
+    try:
+        return json.loads(lines[-1])
+    except json.JSONDecodeError:
+        return {"error": lines[-1]}
+
+
+def benchmark(target, runs):
+    samples = [run_probe(target) for _ in range(runs)]
+    ok = [s for s in samples if "error" not in s]
+    summary = {"target": target, "runs": runs, "failed": runs - len(ok)}
+    if not ok:
+        summary["error"] = samples[-1]["error"]
+        return summary
+    for key in ("import", "first_request"):
+        values = [s[key] for s in ok]
+        summary[key] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and first-request time of server.py and main.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target", choices=sorted(_PROBES), action="append",
+                        help="target to measure (default: all)")
+    parser.add_argument("--output", help="append the results as JSON line to this file")
+    args = parser.parse_args()
+
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backends": {name: os.getenv(name, "default") for name in ("LLM_BACKEND", "TTS_BACKEND", "STT_BACKEND")},
+        "results": [benchmark(target, args.runs) for target in (args.target or sorted(_PROBES))],
+    }
+
+    for result in record["results"]:
+        if "error" in result:
+            print(f"{result['target']:>8}: failed ({result['error']})")
+            continue
+        print(f"{result['target']:>8}: import {result['import']['median']*1000:8.1f} ms   "
+              f"first request {result['first_request']['median']*1000:8.1f} ms   "
+              f"(median of {result['runs'] - result['failed']} runs)")
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
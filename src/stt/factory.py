@@ -1,11 +1,15 @@
-from stt.whisper_local import WhisperLocal
-from stt.whisper_openai import WhisperOpenAi
-from stt.cli_text import CLIText
+import os
+from backends import load_backend
 
 class STTFactory:
+    # select with the environment variable STT_BACKEND
+    backends = {
+        "whisper_openai": "stt.whisper_openai:WhisperOpenAi",
+        "whisper_local": "stt.whisper_local:WhisperLocal",
+        "cli_text": "stt.cli_text:CLIText",
+    }
+    default = "whisper_openai"
 
     @classmethod
-    def create(cls):
-        #return  WhisperLocal()
-        return WhisperOpenAi()
-        #return CLIText()
+    def create(cls, name=None):
+        return load_backend(cls.backends, name or os.getenv("STT_BACKEND", cls.default))()
@@ -1,5 +1,62 @@
+import queue
+import threading
+
 from stt.base import BaseSTT
-from RealtimeSTT import AudioToTextRecorder
+from speechmodels import ModelRegistry
+
+
+class _Microphone:
+    """
+    The one listener of the process: a thread which transcribes the local microphone with the
+    shared recorder and hands the text to the session listening at the moment (the newest one).
+    A stopped session only unregisters, so it never holds up the others.
+    """
+    _lock = threading.Lock()
+    _instance = None
+
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self):
+        self.recorder = ModelRegistry.whisper_recorder(language="de", model="medium").model
+        self.recorder.on_recording_start = self._on_recording_start
+        self.listeners = []
+        self.condition = threading.Condition()
+        threading.Thread(target=self._run, daemon=True, name="whisper-local").start()
+
+    def listen(self, listener):
+        with self.condition:
+            self.listeners.append(listener)
+            self.condition.notify()
+
+    def unlisten(self, listener):
+        with self.condition:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _current(self):
+        with self.condition:
+            return self.listeners[-1] if self.listeners else None
+
+    def _on_recording_start(self):
+        listener = self._current()
+        if listener is not None:
+            listener.on_speech_start()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.listeners:
+                    self.condition.wait()
+            transcription = self.recorder.text()
+            listener = self._current()
+            # nobody listens anymore (e.g. the session was closed): the text is dropped
+            if transcription and listener is not None:
+                listener.transcriptions.put(transcription)
 
 
 class WhisperLocal(BaseSTT):
@@ -9,21 +66,25 @@ class WhisperLocal(BaseSTT):
         if on_speech_start is None:
             on_speech_start = lambda: None  # Leere Lambda-Funktion
 
-        self.recorder = AudioToTextRecorder( 
-            language="de",
-            model="medium", 
-            print_transcription_time=True)
-        self.recorder.on_recording_start = on_speech_start
+        # the recorder (and its model) is loaded once per process and shared by all sessions
+        self.microphone = _Microphone.get()
+        self.on_speech_start = on_speech_start
+        self.transcriptions = queue.Queue()
 
     def stop(self):
         self._stopped = True
+        self.microphone.unlisten(self)
+        # wakes up start_recording
+        self.transcriptions.put(None)
 
     def start_recording(self):
         print("LargeSTT is ready. Wait until it says 'speak now'")
-        # Call text() synchronously to get the transcription result.
-        while not self._stopped:
-            transcription = self.recorder.text()
-            if self._stopped:
-                break
-            if transcription:
-                yield transcription
\ No newline at end of file
+        self.microphone.listen(self)
+        try:
+            while not self._stopped:
+                transcription = self.transcriptions.get()
+                if self._stopped or transcription is None:
+                    break
+                yield transcription
+        finally:
+            self.microphone.unlisten(self)
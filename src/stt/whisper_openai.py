@@ -1,8 +1,8 @@
-import speech_recognition as sr
 import pyaudio
 import time
+import threading
 import traceback
-from openai import OpenAI
+from clients import ClientRegistry
 import wave
 import io
 
@@ -13,7 +13,8 @@ _false_positiv = ["Amara.org", "Untertitel ", "Pff"]
 
 class WhisperOpenAi(BaseSTT):
     def __init__(self, on_speech_start=None):
-        self.vad = WebrtcVad(on_speech_start=self.on_speech_start, on_speech_end=self.on_speech_end, on_speech_data=self.on_speech_data)
+        # the VAD opens the microphone; it is created when the recording starts
+        self.vad = None
         self.frames = []
         self._stopped = False
         self.transcription_ready = False
@@ -21,11 +22,15 @@ class WhisperOpenAi(BaseSTT):
         if on_speech_start is None:
             on_speech_start = lambda: None  # Leere Lambda-Funktion
         self.on_speech_start_callback = on_speech_start
+        # Optional callback for partial transcripts: the audio so far is transcribed at every
+        # short pause of the speaker (speculative chat, see speculation.py)
+        self.on_partial_transcript = None
 
 
     def stop(self):
         self.do_run = False
-        self.vad.close()
+        if self.vad is not None:
+            self.vad.close()
 
 
     def on_speech_start(self):
@@ -44,6 +49,19 @@ class WhisperOpenAi(BaseSTT):
             pass
 
 
+    def on_speech_pause(self):
+        callback = self.on_partial_transcript
+        if callback is None or not self.frames:
+            return
+        frames = list(self.frames)
+
+        def transcribe_partial():
+            text = self.transcribe(frames)
+            if text and not self._is_false_positive(text):
+                callback(text)
+        threading.Thread(target=transcribe_partial, daemon=True).start()
+
+
     def on_speech_data(self, frame, sample_rate):
         self.frames.append(frame)
         return (frame, pyaudio.paContinue)
@@ -70,12 +88,12 @@ class WhisperOpenAi(BaseSTT):
         return buffer
 
 
-    def transcribe(self):
+    def transcribe(self, frames=None):
         try:
             start_time = time.time()
-            wav_buffer = self._create_wav_file(self.frames, self.vad.sample_rate)
+            wav_buffer = self._create_wav_file(self.frames if frames is None else frames, self.vad.sample_rate)
 
-            client = OpenAI()
+            client = ClientRegistry.openai()
             # Prepare the file parameter as a tuple
             filename = "audio.wav"  # Name of the file to be sent
             content_type = "audio/wav"  # Set content type for WAV files
@@ -101,6 +119,9 @@ class WhisperOpenAi(BaseSTT):
         # Start the VAD process and yield transcriptions as they become available
         print("Starting VAD...")
         try:
+            if self.vad is None:
+                self.vad = WebrtcVad(on_speech_start=self.on_speech_start, on_speech_end=self.on_speech_end, on_speech_data=self.on_speech_data,
+                                     on_speech_pause=self.on_speech_pause)
             self.vad.start()
             self.do_run = True
             while self.do_run == True:
@@ -116,5 +137,6 @@ class WhisperOpenAi(BaseSTT):
             print(f"Error starting VAD: {e}")
             traceback.print_exc()
         finally:
-            self.vad.close()
+            if self.vad is not None:
+                self.vad.close()
 
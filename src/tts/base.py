@@ -1,24 +1,407 @@
 import abc
 import asyncio
-from typing import Callable, Awaitable, Union
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Awaitable, Union, Iterator
+
+from tts.cache import AudioCache, audio_cache
+from tts.scheduler import tts_scheduler, FIRST_SENTENCE, LATER_SENTENCE
+from tts.playback import playback_pool
+from segmenter import SentenceSegmenter
+
+# yielded instead of a chunk while the audio is not there yet; the playback is woken when it arrives
+WAIT = object()
+
+
+class SentenceFeed:
+    """
+    Handle returned by `BaseTTS.speak_stream`. The producer (e.g. the LLM stream) puts finished
+    sentences in order and closes the feed at the end. Safe to use from any thread.
+    """
+    def __init__(self, wake: Callable[[], None] = lambda: None):
+        self.queue = queue.Queue()
+        self.closed = False
+        self.wake = wake
+
+    def put(self, sentence: str) -> None:
+        if sentence:
+            self.queue.put(sentence)
+            self.wake()
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.wake()
+
+    def get(self, block: bool = True):
+        """Next sentence, None once the feed is closed; raises queue.Empty if not blocking and nothing is there."""
+        if self.closed:
+            return None
+        sentence = self.queue.get(block)
+        if sentence is None:
+            self.closed = True
+        return sentence
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.get, None)
+
+
+class _Prefetch:
+    """
+    Synthesizes one sentence in the shared scheduler. Iterating yields the chunks as soon as they
+    arrive, and WAIT while the next one is not there yet; `wake` is called for each new one.
+    """
+    def __init__(self, chunks: Callable[[], Iterator[bytes]], tts, priority, wake: Callable[[], None]):
+        self.queue = queue.Queue()
+        self.cancelled = threading.Event()
+        self.wake = wake
+        tts_scheduler.submit(lambda: self._run(chunks), type(tts).__name__, owner=id(tts),
+                             limit=tts.max_concurrency, priority=priority)
+
+    def _run(self, chunks):
+        if self.cancelled.is_set():
+            # stopped while queued
+            self._put(None)
+            return
+        generator = chunks()
+        try:
+            for chunk in generator:
+                if self.cancelled.is_set():
+                    break
+                self._put(chunk)
+        except Exception as e:
+            self._put(e)
+        finally:
+            generator.close()
+            self._put(None)
+
+    def _put(self, item):
+        self.queue.put(item)
+        self.wake()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        # ends the iteration of a reader waiting for the next chunk
+        self._put(None)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                yield WAIT
+                continue
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class _Playback:
+    """
+    State of one playback. Each playback has its own stop event, so stopping it never has to wait
+    for it: a new playback can start right away while the old one ends with its next step.
+    """
+    def __init__(self):
+        self.stopped = threading.Event()
+        self.feed = None
+        self.prefetches = []
+        # the task in the playback pool, once started
+        self.task = None
+        self._lock = threading.Lock()
+
+    def wake(self) -> None:
+        task = self.task
+        if task is not None:
+            task.wake()
+
+    def track(self, prefetch: _Prefetch) -> _Prefetch:
+        with self._lock:
+            if self.stopped.is_set():
+                prefetch.cancel()
+            else:
+                self.prefetches.append(prefetch)
+        return prefetch
+
+    def stop(self) -> None:
+        with self._lock:
+            self.stopped.set()
+            prefetches, self.prefetches = self.prefetches, []
+        if self.feed is not None:
+            self.feed.close()
+        for prefetch in prefetches:
+            prefetch.cancel()
+        # also if it waits for room in the sink
+        self.wake()
+
+
+class _Player:
+    """
+    Writes the chunks of one playback to the audio sink, as a task of the shared playback pool.
+    A step writes what is there without waiting; the playback is woken again by a new sentence,
+    synthesized audio, room in the sink or a stop.
+    """
+    def __init__(self, tts, session, playback, chunks, on_start, on_complete, on_finish):
+        self.tts = tts
+        self.session = session
+        self.playback = playback
+        self.chunks = chunks
+        self.on_start = on_start
+        self.on_complete = on_complete
+        self.on_finish = on_finish
+        self.started = False
+        self.recorded = [] if on_complete is not None else None
+        # the chunk the sink had no room for, and when it is dropped
+        self.pending = None
+        self.deadline = None
+
+    def step(self) -> bool:
+        """Returns True once the playback is finished."""
+        try:
+            while True:
+                # checked right before each write: after `stop` at most the chunk being written goes out
+                if self.playback.stopped.is_set():
+                    return self._finish()
+                if self.pending is None:
+                    chunk = next(self.chunks, None)
+                    if chunk is None:
+                        if self.recorded is not None and not self.playback.stopped.is_set():
+                            self.on_complete(self.recorded)
+                        return self._finish()
+                    if chunk is WAIT:
+                        return False
+                    if not chunk:
+                        continue
+                    if not self.started:
+                        self.started = True
+                        self.tts.run_callback(self.on_start, self.session)
+                    self.pending = chunk
+                if not self._write():
+                    return False
+        except Exception as e:
+            print(f"Error in playback: {e}")
+            return self._finish()
+
+    def _write(self):
+        """False if the sink has no room yet; the task is woken when it has or when the chunk is dropped."""
+        sink = self.tts.audio_sink
+        chunk = self.pending
+        if not sink.offer(self.session, chunk, self.playback.wake):
+            if self.deadline is None:
+                if sink.block_timeout is None:
+                    return False
+                self.deadline = time.monotonic() + sink.block_timeout
+                self.playback.task.wake_later(sink.block_timeout)
+                return False
+            if time.monotonic() < self.deadline:
+                return False
+            print(f"Audio sink full; dropped {len(chunk)} bytes.")
+        elif self.recorded is not None:
+            self.recorded.append(bytes(chunk))
+        self.pending = None
+        self.deadline = None
+        return True
+
+    def _finish(self):
+        self.pending = None
+        try:
+            # stops the synthesis of sentences which will not be played anymore
+            close = getattr(self.chunks, "close", None)
+            if close is not None:
+                close()
+        finally:
+            if self.on_finish is not None:
+                self.on_finish()
+        return True
+
 
 # Definition of BaseTTS class
 class BaseTTS(abc.ABC):
+    # synthesized audio is stored in the on-disk cache (see tts/cache.py)
+    cacheable = True
+    # Sentences synthesized at the same time: the one playing and up to K-1 ahead. Backends whose
+    # synthesis is a remote request opt in with K > 1.
+    synthesis_parallelism = 1
+    # Syntheses of this backend running at once over all sessions (None: only TTS_SYNTHESIS_THREADS);
+    # can be overridden with TTS_BACKEND_LIMITS
+    max_concurrency = None
+    # of the int16 mono PCM returned by `synthesize`
+    sample_rate = 24000
+
     def __init__(self, audio_sink):
         self.audio_sink = audio_sink
+        self.playback = _Playback()
         # Speichern des aktuellen Event-Loops beim Initialisieren
         try:
             self.loop = asyncio.get_running_loop()
         except RuntimeError:
             self.loop = asyncio.get_event_loop()
 
+
     @abc.abstractmethod
-    async def speak(self, session, text, on_start: Callable = lambda session: None):
+    def synthesize(self, text) -> Iterator[bytes]:
+        """Yields the raw PCM (int16, mono) audio for `text` chunk by chunk."""
         pass
 
-    @abc.abstractmethod
+
+    def cache_params(self) -> dict:
+        """Everything besides the text which changes the synthesized audio (voice, speed, model, ...)."""
+        return {}
+
+
+    def synthesize_cached(self, text) -> Iterator[bytes]:
+        """`synthesize` behind the audio cache. Cached audio is returned as memoryview slices."""
+        cached = self._cached(text)
+        if cached is not None:
+            yield from cached
+        else:
+            yield from self._synthesize_and_store(text)
+
+
+    def _cached(self, text):
+        if not self.cacheable:
+            return None
+        return audio_cache.read(AudioCache.key(type(self).__name__, self.cache_params(), text))
+
+
+    def _synthesize_and_store(self, text):
+        if not self.cacheable:
+            return self.synthesize(text)
+        return audio_cache.write(AudioCache.key(type(self).__name__, self.cache_params(), text), self.synthesize(text))
+
+
+    def _sentence_audio(self, text, playback, first):
+        """
+        Iterable over the audio of one sentence. Cache hits are read lazily by the playback (each
+        memoryview slice is released once the sink has taken it); misses are synthesized by the
+        scheduler, the first sentence of a reply with priority.
+        """
+        cached = self._cached(text)
+        if cached is not None:
+            return cached
+        priority = FIRST_SENTENCE if first else LATER_SENTENCE
+        return playback.track(_Prefetch(lambda: self._synthesize_and_store(text), self, priority, playback.wake))
+
+
+    def speak(self, session, text, on_start: Callable = lambda session: None,
+              on_finish: Callable[[], None] = None):
+        # sentence by sentence, so the first one plays while the next ones are synthesized
+        segmenter = SentenceSegmenter()
+        feed = self.speak_stream(session, on_start=on_start, on_finish=on_finish)
+        for sentence in segmenter.feed(text.replace("\n", " ")) + segmenter.flush():
+            feed.put(sentence)
+        feed.close()
+
+
+    async def aspeak(self, session, text, on_start: Callable = lambda session: None) -> bool:
+        """
+        Async variant of `speak`: returns once the whole text has been handed to the audio sink,
+        or earlier if the playback is stopped. Never blocks the event loop. Returns False if stopped.
+        """
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def on_finish():
+            loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+
+        self.speak(session, text, on_start=on_start, on_finish=on_finish)
+        playback = self.playback
+        await finished
+        return not playback.stopped.is_set()
+
+
+    def speak_stream(self, session, on_start: Callable = lambda session: None,
+                     on_complete: Callable[[list], None] = None,
+                     on_finish: Callable[[], None] = None) -> SentenceFeed:
+        """
+        Starts playback of text which is not complete yet. Sentences put into the returned feed
+        are synthesized and written to the audio sink strictly in order. `on_start` is called
+        with the first audio chunk. If given, `on_complete` is called (in the playback pool)
+        with all PCM chunks once the feed has been played completely without being stopped;
+        `on_finish` is called when the playback ends, stopped or not.
+        """
+        # Ensure any ongoing playback is stopped before starting a new one
+        self.stop(session)
+
+        playback = self.playback = _Playback()
+        feed = playback.feed = SentenceFeed(playback.wake)
+
+        def chunks():
+            # sentences in order: the first one is playing, the others are synthesized ahead
+            window = deque()
+            sentences = 0
+
+            def fill():
+                nonlocal sentences
+                while len(window) < self.synthesis_parallelism and not playback.stopped.is_set():
+                    try:
+                        sentence = feed.get(block=False)
+                    except queue.Empty:
+                        return
+                    if sentence is None:
+                        return
+                    window.append((sentence, self._sentence_audio(sentence, playback, first=sentences == 0)))
+                    sentences += 1
+
+            try:
+                while True:
+                    fill()
+                    if playback.stopped.is_set():
+                        return
+                    if not window:
+                        if feed.closed:
+                            return
+                        # the next sentence is not there yet
+                        yield WAIT
+                        continue
+                    sentence, audio = window[0]
+                    try:
+                        for chunk in audio:
+                            yield chunk
+                            # sentences which arrived in the meantime start right away
+                            fill()
+                    except Exception as e:
+                        # skip the sentence, continue with the next one
+                        print(f"Error synthesizing '{sentence}': {e}")
+                    window.popleft()
+            finally:
+                for _, audio in window:
+                    if isinstance(audio, _Prefetch):
+                        audio.cancel()
+                    elif hasattr(audio, "close"):
+                        audio.close()
+
+        self._start_playback(session, playback, chunks(), on_start, on_complete, on_finish)
+        return feed
+
+
+    def play(self, session, chunks, on_start: Callable = lambda session: None):
+        """Plays already synthesized PCM chunks (e.g. from a cache)."""
+        self.stop(session)
+        self.playback = _Playback()
+        self._start_playback(session, self.playback, iter(chunks), on_start)
+
+
+    def _start_playback(self, session, playback, chunks, on_start, on_complete=None, on_finish=None):
+        player = _Player(self, session, playback, chunks, on_start, on_complete, on_finish)
+        # the task is known to the playback before its first step, so no wake-up gets lost
+        playback.task = playback_pool.create(player.step)
+        playback.task.wake()
+
+
     def stop(self, session):
-        pass
+        """
+        Cancels the current playback and drops the audio already queued in the sink. Returns
+        immediately: the playback ends with its next step in the playback pool, after the chunk
+        it is currently writing. Safe to call from the event loop.
+        """
+        self.playback.stop()
+        try:
+            self.audio_sink.clear(session)
+        except Exception as e:
+            print(f"Error in stop method: {e}")
 
 
     def run_callback(self, callback: Union[Callable[[object], None], Awaitable], session):
@@ -34,4 +417,4 @@ class BaseTTS(abc.ABC):
         else:
             # Andernfalls führe den synchronen Callback im Haupt-Event-Loop aus
             #loop = asyncio.get_running_loop()
-            self.loop.call_soon_threadsafe(callback, session)
\ No newline at end of file
+            self.loop.call_soon_threadsafe(callback, session)
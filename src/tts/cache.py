@@ -0,0 +1,149 @@
+import os
+import json
+import mmap
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Content-addressed PCM cache on disk, shared by all sessions (and workers on the same host)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "chatbot_tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", 256 * 1024 * 1024))   # 0 disables the cache
+TTS_CACHE_CHUNK_BYTES = 8192
+
+
+class AudioCache:
+    """
+    Raw PCM per (backend, voice parameters, normalized text), one file per entry. Hits are read
+    through a memory map and handed out as memoryview slices, so no copy is made until the
+    sink consumes them. The least recently used files are deleted beyond `max_bytes`.
+    """
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.files = None   # path -> size, in LRU order; loaded on first use
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.served_bytes = 0
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def key(backend, params, text):
+        normalized = " ".join(text.split())
+        raw = json.dumps([backend, params, normalized], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+    def read(self, key):
+        """Returns an iterator over the cached PCM of `key` or None on a miss."""
+        if self.max_bytes <= 0:
+            return None
+        path = self._path(key)
+        with self._lock:
+            self._load()
+            if path not in self.files and os.path.exists(path):
+                # stored by another worker
+                self.files[path] = os.path.getsize(path)
+                self.total_bytes += self.files[path]
+            if path not in self.files:
+                self.misses += 1
+                return None
+            self.files.move_to_end(path)
+            self.hits += 1
+        return self._chunks(path)
+
+
+    def write(self, key, chunks):
+        """Passes `chunks` through and stores them once the iterator has been consumed completely."""
+        if self.max_bytes <= 0:
+            yield from chunks
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            if size > 0:
+                path = self._path(key)
+                os.replace(temp_path, path)
+                self._added(path, size)
+        finally:
+            # interrupted (stop) or failed synthesis: nothing is stored
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "served_bytes": self.served_bytes,
+                "entries": len(self.files or {}),
+                "bytes": self.total_bytes,
+            }
+
+
+    def _chunks(self, path):
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for start in range(0, len(view), TTS_CACHE_CHUNK_BYTES):
+                        chunk = view[start:start + TTS_CACHE_CHUNK_BYTES]
+                        try:
+                            yield chunk
+                        finally:
+                            # only valid during the sink's write (see BaseAudioSink); the mapping can only be closed without exports
+                            chunk.release()
+                    with self._lock:
+                        self.served_bytes += len(view)
+                finally:
+                    view.release()
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            # evicted by another worker in the meantime
+            print(f"TTS cache entry not readable: {e}")
+
+
+    def _added(self, path, size):
+        with self._lock:
+            self._load()
+            self.total_bytes += size - self.files.pop(path, 0)
+            self.files[path] = size
+            while self.total_bytes > self.max_bytes and len(self.files) > 1:
+                oldest, oldest_size = self.files.popitem(last=False)
+                self.total_bytes -= oldest_size
+                try:
+                    os.remove(oldest)
+                except OSError:
+                    pass
+
+
+    def _load(self):
+        """Indexes the existing files once, oldest access first."""
+        if self.files is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pcm"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+        self.files = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self.total_bytes = sum(self.files.values())
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pcm")
+
+
+audio_cache = AudioCache()
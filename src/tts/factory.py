@@ -1,15 +1,16 @@
-from tts.openai import OpenAiTTS
-from tts.console import Console
-#from tts.piper import PiperTTS
-from tts.google import GoogleTTS
+import os
+from backends import load_backend
 
 class TTSEngineFactory:
+    # select with the environment variable TTS_BACKEND
+    backends = {
+        "openai": "tts.openai:OpenAiTTS",
+        "google": "tts.google:GoogleTTS",
+        "piper": "tts.piper:PiperTTS",
+        "console": "tts.console:Console",
+    }
+    default = "openai"
 
     @classmethod
-    def create(cls, audio_sink):
-        return OpenAiTTS(audio_sink)
-        #return CoquiTTS(audio_sink)
-        #return PyTTS(audio_sink)
-        #return Console(audio_sink)
-        #return PiperTTS(audio_sink)
-        #return GoogleTTS(audio_sink)
+    def create(cls, audio_sink, name=None):
+        return load_backend(cls.backends, name or os.getenv("TTS_BACKEND", cls.default))(audio_sink)
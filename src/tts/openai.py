@@ -1,69 +1,52 @@
 from tts.base import BaseTTS
 
-import threading
 import time
-from openai import OpenAI
-from typing import Callable
+from clients import ClientRegistry
 
 class OpenAiTTS(BaseTTS):
+    # one streaming request per sentence; up to two more sentences are requested ahead
+    synthesis_parallelism = 3
+    # concurrent requests of all sessions, below the rate limit of the account
+    max_concurrency = 8
+
     def __init__(self, audio_sink):
         super().__init__(audio_sink)
-        self.stop_event = threading.Event()
         self.player_stream = None
-        self.client = OpenAI()
-        self.audio_thread = None
+        self.client = ClientRegistry.openai()
         self.max_retries = 3
+        self.voice = "onyx"
+        self.speed = 1.2
+        self.model = "tts-1"
 
 
-    def speak(self, session, text, on_start: Callable = lambda session: None):
-        # Ensure any ongoing playback is stopped before starting a new one
-        self.stop(session)
+    def cache_params(self):
+        return {"voice": self.voice, "speed": self.speed, "model": self.model}
 
-        # Clear the stop event
-        self.stop_event.clear()
 
-        def play_audio():
+    def synthesize(self, text):
+        # Attempt to stream audio with retries
+        retries = 0
+        while True:
+            started = False
             try:
-
-                # Attempt to stream audio with retries
-                retries = 0
-                while retries < self.max_retries:
-                    try:
-                        with self.client.audio.speech.with_streaming_response.create(
-                            input=text,
-                            speed=1.2,
-                            response_format="pcm",
-                            voice="onyx",
-                            model="tts-1"
-                        ) as response:
-                            self.run_callback(on_start, session)
-                            for chunk in response.iter_bytes(chunk_size=8192):
-                                if self.stop_event.is_set():
-                                    break
-                                self.audio_sink.write(session, chunk)
-                        break  # Exit loop if streaming succeeds
-                    except (ConnectionError, TimeoutError) as e:
-                        retries += 1
-                        print(f"Connection error ({retries}/{self.max_retries}): {e}")
-                        time.sleep(1)
-                    except Exception as e:
-                        print(f"Unexpected error during streaming: {e}")
-                        break
+                with self.client.audio.speech.with_streaming_response.create(
+                    input=text,
+                    speed=self.speed,
+                    response_format="pcm",
+                    voice=self.voice,
+                    model=self.model
+                ) as response:
+                    for chunk in response.iter_bytes(chunk_size=8192):
+                        started = True
+                        yield chunk
+                return
+            except (ConnectionError, TimeoutError) as e:
+                retries += 1
+                print(f"Connection error ({retries}/{self.max_retries}): {e}")
+                # a retry after the first chunk would repeat the beginning of the sentence
+                if started or retries >= self.max_retries:
+                    raise
+                time.sleep(1)
             except Exception as e:
-                print(f"Error in play_audio thread: {e}")
-
-        self.audio_thread = threading.Thread(target=play_audio)
-        self.audio_thread.start()
-
-
-    def stop(self, session):
-        try:
-            self.stop_event.set()
-
-            # Wait for the audio thread to finish if it's still running
-            if self.audio_thread is not None and self.audio_thread.is_alive():
-                self.audio_thread.join()
-            self.audio_thread = None
-        except Exception as e:
-            print(f"Error in stop method: {e}")
-
+                print(f"Unexpected error during streaming: {e}")
+                raise
@@ -0,0 +1,144 @@
+import os
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+# Worker threads which write the audio of all playbacks to their sinks
+TTS_PLAYBACK_THREADS = int(os.getenv("TTS_PLAYBACK_THREADS", 4))
+
+_IDLE = 0
+_QUEUED = 1
+_RUNNING = 2
+
+
+class PlaybackTask:
+    """
+    One playback in the pool. Its step runs again after `wake()` (safe to call from any thread,
+    also while the step is running) until the step returns True.
+    """
+    __slots__ = ("pool", "step", "state", "again", "finished")
+
+    def __init__(self, pool, step):
+        self.pool = pool
+        self.step = step
+        self.state = _IDLE
+        self.again = False
+        self.finished = False
+
+    def wake(self) -> None:
+        self.pool._wake(self)
+
+    def wake_later(self, seconds) -> None:
+        """Wakes the task after `seconds` at the latest (e.g. the timeout of a blocked write)."""
+        self.pool._wake_later(self, seconds)
+
+
+class PlaybackPool:
+    """
+    Bounded worker pool for the playbacks of all sessions. A playback does not own a thread:
+    each step writes what is available without waiting and returns; the playback is woken again
+    when it can go on (a new sentence, synthesized audio, room in the sink, a stop). So the number
+    of threads does not grow with the number of sessions which are speaking.
+    """
+    def __init__(self, workers=TTS_PLAYBACK_THREADS):
+        self.workers = workers
+        self.ready = deque()
+        # (deadline, sequence, task)
+        self.timers = []
+        self.threads = 0
+        self.idle = 0       # workers waiting on the condition
+        self.starting = 0   # workers started but not yet looking for a task
+        self.active = 0
+        self.steps = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+
+    def create(self, step) -> PlaybackTask:
+        """Task for `step()`, which returns True once the playback is finished. Runs after the first `wake()`."""
+        with self._condition:
+            self.active += 1
+        return PlaybackTask(self, step)
+
+
+    def stats(self):
+        with self._condition:
+            return {
+                "workers": self.threads,
+                "idle": self.idle,
+                "playbacks": self.active,
+                "ready": len(self.ready),
+                "steps": self.steps,
+            }
+
+
+    def _wake(self, task):
+        with self._condition:
+            self._schedule(task)
+
+
+    def _wake_later(self, task, seconds):
+        with self._condition:
+            heapq.heappush(self.timers, (time.monotonic() + seconds, next(self._sequence), task))
+            # a waiting worker has to shorten its timeout
+            self._condition.notify()
+
+
+    def _schedule(self, task):
+        """Call with the lock held."""
+        if task.finished or task.state == _QUEUED:
+            return
+        if task.state == _RUNNING:
+            # woken while its step runs: the step has to run once more
+            task.again = True
+            return
+        task.state = _QUEUED
+        self.ready.append(task)
+        if self.idle:
+            self._condition.notify()
+        if self.threads < self.workers and len(self.ready) > self.idle + self.starting:
+            self.threads += 1
+            self.starting += 1
+            threading.Thread(target=self._work, daemon=True, name=f"tts-playback-{self.threads}").start()
+
+
+    def _next(self):
+        """Next ready task, waiting for one (or for a timer); call with the lock held."""
+        while True:
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                self._schedule(heapq.heappop(self.timers)[2])
+            if self.ready:
+                task = self.ready.popleft()
+                task.state = _RUNNING
+                return task
+            self.idle += 1
+            self._condition.wait(self.timers[0][0] - now if self.timers else None)
+            self.idle -= 1
+
+
+    def _work(self):
+        with self._condition:
+            self.starting -= 1
+        while True:
+            with self._condition:
+                task = self._next()
+            try:
+                finished = task.step()
+            except Exception as e:
+                print(f"Error in playback: {e}")
+                finished = True
+            with self._condition:
+                self.steps += 1
+                task.state = _IDLE
+                if finished:
+                    task.finished = True
+                    self.active -= 1
+                elif task.again:
+                    task.again = False
+                    self._schedule(task)
+
+
+playback_pool = PlaybackPool()
@@ -0,0 +1,139 @@
+import os
+import threading
+from collections import OrderedDict, deque
+
+# Worker threads for the synthesis of all sessions together
+TTS_SYNTHESIS_THREADS = int(os.getenv("TTS_SYNTHESIS_THREADS", 16))
+# Concurrent syntheses per backend class, e.g. "OpenAiTTS=8,GoogleTTS=4"; overrides BaseTTS.max_concurrency
+TTS_BACKEND_LIMITS = os.getenv("TTS_BACKEND_LIMITS", "")
+
+FIRST_SENTENCE = 0
+LATER_SENTENCE = 1
+
+
+def parse_limits(value):
+    limits = {}
+    for entry in value.split(","):
+        name, _, limit = entry.partition("=")
+        if name.strip() and limit.strip():
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class _Job:
+    __slots__ = ("run", "backend", "limit")
+
+    def __init__(self, run, backend, limit):
+        self.run = run
+        self.backend = backend
+        self.limit = limit
+
+
+class TTSScheduler:
+    """
+    Bounded worker pool for the synthesis jobs of all sessions:
+    - at most `workers` jobs run at once, and per backend at most its limit (upstream rate limits)
+    - the first sentence of a reply goes before later sentences, which are only look-ahead
+    - within a priority the sessions take turns, so one long reply cannot hold up the others
+    Jobs of the same owner and priority run in the order they were submitted.
+    """
+    def __init__(self, workers=TTS_SYNTHESIS_THREADS, limits=None):
+        self.workers = workers
+        self.limits = parse_limits(TTS_BACKEND_LIMITS) if limits is None else limits
+        # per priority: owner -> jobs, in round robin order
+        self.queues = (OrderedDict(), OrderedDict())
+        self.running = {}
+        self.threads = 0
+        self.idle = 0       # workers waiting on the condition
+        self.starting = 0   # workers started but not yet looking for a job
+        self.completed = 0
+        self._condition = threading.Condition()
+
+
+    def submit(self, run, backend, owner, limit=None, priority=LATER_SENTENCE):
+        """
+        Queues `run()` for a worker. `owner` is the unit of fairness (one TTS instance per session),
+        `limit` the backend's own concurrency limit (None: only the global one).
+        """
+        job = _Job(run, backend, self.limits.get(backend, limit))
+        with self._condition:
+            self.queues[priority].setdefault(owner, deque()).append(job)
+            if self.idle:
+                self._condition.notify()
+            # workers are started on demand (e.g. for a burst of look-ahead sentences) and stay
+            if self.threads < self.workers and self._runnable() > self.idle + self.starting:
+                self.threads += 1
+                self.starting += 1
+                threading.Thread(target=self._work, daemon=True, name=f"tts-{self.threads}").start()
+
+
+    def stats(self):
+        with self._condition:
+            return {
+                "workers": self.threads,
+                "idle": self.idle,
+                "queued_first": sum(len(jobs) for jobs in self.queues[FIRST_SENTENCE].values()),
+                "queued_later": sum(len(jobs) for jobs in self.queues[LATER_SENTENCE].values()),
+                "running": {backend: count for backend, count in self.running.items() if count},
+                "completed": self.completed,
+            }
+
+
+    def _runnable(self):
+        """Queued jobs which could start now, within the backend limits; call with the lock held."""
+        free = {}
+        count = 0
+        for queues in self.queues:
+            for jobs in queues.values():
+                for job in jobs:
+                    if job.limit is None:
+                        count += 1
+                        continue
+                    slots = free.setdefault(job.backend, job.limit - self.running.get(job.backend, 0))
+                    if slots > 0:
+                        free[job.backend] = slots - 1
+                        count += 1
+        return count
+
+
+    def _next(self):
+        """Next job whose backend has a free slot; call with the lock held."""
+        for queues in self.queues:
+            for owner, jobs in queues.items():
+                job = jobs[0]
+                if job.limit is not None and self.running.get(job.backend, 0) >= job.limit:
+                    continue
+                jobs.popleft()
+                if jobs:
+                    queues.move_to_end(owner)
+                else:
+                    del queues[owner]
+                return job
+        return None
+
+
+    def _work(self):
+        with self._condition:
+            self.starting -= 1
+        while True:
+            with self._condition:
+                job = self._next()
+                while job is None:
+                    self.idle += 1
+                    self._condition.wait()
+                    self.idle -= 1
+                    job = self._next()
+                self.running[job.backend] = self.running.get(job.backend, 0) + 1
+            try:
+                job.run()
+            except Exception as e:
+                print(f"Error in TTS job: {e}")
+            finally:
+                with self._condition:
+                    self.running[job.backend] -= 1
+                    self.completed += 1
+                    # a slot of this backend became free
+                    self._condition.notify_all()
+
+
+tts_scheduler = TTSScheduler()
@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Size 0 disables the cache
+TURN_CACHE_SIZE = int(os.getenv("TURN_CACHE_SIZE", 32))
+TURN_CACHE_TTL = float(os.getenv("TURN_CACHE_TTL", 24 * 3600))
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class TurnCache:
+    """
+    Exact-match cache for deterministic turns (e.g. the "start" intro). An entry holds everything
+    needed to replay the turn without LLM and TTS: the raw sentences (with tags), the cleaned
+    answer, the LLM history after the turn and the synthesized PCM chunks.
+    Entries expire after `ttl` seconds; beyond `max_entries` the least recently used one is dropped.
+    """
+    def __init__(self, max_entries=TURN_CACHE_SIZE, ttl=TURN_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()   # key -> (stored_at, entry)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def key(session, text):
+        """
+        (LLM backend and model, TTS backend, system prompt hash, history hash, input) or None if the
+        LLM backend cannot export its history and therefore cannot be restored from the cache.
+        """
+        llm = session.llm
+        try:
+            history = llm.get_history()
+        except NotImplementedError:
+            return None
+        return (llm.cache_id(), type(session.tts).__name__,
+                _digest(session.system_prompt), _digest(history), text)
+
+
+    def get(self, key):
+        if key is None or self.max_entries <= 0:
+            return None
+        with self._lock:
+            item = self.entries.get(key)
+            if item is not None and time.monotonic() - item[0] > self.ttl:
+                del self.entries[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+
+    def put(self, key, entry):
+        if key is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self.entries[key] = (time.monotonic(), entry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+    def __len__(self):
+        return len(self.entries)
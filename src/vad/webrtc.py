@@ -4,7 +4,7 @@ import traceback
 from vad.base import BaseVad
 
 class WebrtcVad(BaseVad):
-    def __init__(self, on_speech_start=None, on_speech_end=None, on_speech_data=None):
+    def __init__(self, on_speech_start=None, on_speech_end=None, on_speech_data=None, on_speech_pause=None):
         self.audio_interface = pyaudio.PyAudio()
         self.stream = None
 
@@ -16,6 +16,8 @@ class WebrtcVad(BaseVad):
         self.recording = False
         self.silence_duration = 0  # Track duration of silence
         self.silence_threshold = 700  # Silence threshold in milliseconds
+        self.pause_threshold = 210  # Short pause (maybe the end of the utterance) in milliseconds
+        self.pause_duration = 0  # Silence since the last speech frame
         self.chunk_size = int(self.sample_rate * self.frame_duration_ms / 1000)
 
         if on_speech_data is None:
@@ -30,6 +32,10 @@ class WebrtcVad(BaseVad):
             on_speech_end = lambda: None
         self.on_speech_end = on_speech_end
 
+        if on_speech_pause is None:
+            on_speech_pause = lambda: None
+        self.on_speech_pause = on_speech_pause
+
 
     def start(self):
         self.stream = self.audio_interface.open(
@@ -66,10 +72,14 @@ class WebrtcVad(BaseVad):
                     self.on_speech_start()
                     self.recording = True
                     self.silence_duration = 0
+                self.pause_duration = 0
                 self.on_speech_data(in_data, self.sample_rate)
             else:
                 if self.recording:
                     self.silence_duration += self.frame_duration_ms                    
+                    self.pause_duration += self.frame_duration_ms
+                    if self.pause_duration == self.pause_threshold:
+                        self.on_speech_pause()
                     if self.silence_duration >= self.silence_threshold:
                         print("Silence detected, stopping recording...")
                         self.on_speech_end()
@@ -1,83 +1,327 @@
 from fastapi import WebSocket
-from typing import Dict
-from queue import Queue, Empty
+from typing import Dict, Callable, Awaitable, Optional
+import asyncio
+import json
+import os
+import threading
 import time
 from starlette.websockets import WebSocketState
 
+from audio.codecs import PCMEncoder
+
+
+# 24 kHz, mono, int16 => 48000 bytes per second of audio
+AUDIO_FRAME_BYTES = int(os.getenv("WS_AUDIO_FRAME_BYTES", 9600))       # ~200 ms per websocket frame
+AUDIO_BUFFER_BYTES = int(os.getenv("WS_AUDIO_BUFFER_BYTES", 240000))   # ~5 s per connection
+AUDIO_BLOCK_TIMEOUT = float(os.getenv("WS_AUDIO_BLOCK_TIMEOUT", 2.0))  # seconds a producer may block before its chunk is dropped
+AUDIO_SAMPLE_RATE = 24000
+AUDIO_FLUSH_DELAY = 0.1   # seconds without new audio after which a codec sends the samples it holds back
+
+
+class AudioBuffer:
+    """
+    Bounded, thread-safe byte buffer between the TTS threads and the websocket sender task.
+    Small chunks are merged into frames of up to `frame_bytes`. If the client falls behind,
+    producers block for up to `block_timeout` seconds and the chunk is dropped afterwards;
+    `offer` does not block but calls the producer back once there is room.
+    """
+    def __init__(self, max_bytes=AUDIO_BUFFER_BYTES, frame_bytes=AUDIO_FRAME_BYTES, block_timeout=AUDIO_BLOCK_TIMEOUT):
+        self.max_bytes = max_bytes
+        self.frame_bytes = frame_bytes - (frame_bytes % 2)   # keep int16 samples intact
+        self.block_timeout = block_timeout
+        self.buffer = bytearray()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped_bytes = 0
+        # incremented by `clear`; data of producers which were blocked across a clear is stale
+        self.generation = 0
+        # callbacks of `offer` calls which found the buffer full
+        self.waiters = []
+
+    def put(self, data: bytes) -> bool:
+        """
+        Appends `data`. Returns True if the buffer was empty before, i.e. the consumer has to be woken up.
+        Returns False if the data was merged into pending data or had to be dropped.
+        """
+        deadline = time.monotonic() + self.block_timeout
+        with self.condition:
+            generation = self.generation
+            while not self.closed and len(self.buffer) + len(data) > self.max_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.dropped_bytes += len(data)
+                    print(f"Audio buffer full; dropped {len(data)} bytes (total {self.dropped_bytes}).")
+                    return False
+                self.condition.wait(remaining)
+            if self.closed or self.generation != generation:
+                # the audio was cleared (barge-in) while this producer waited for space
+                return False
+            was_empty = len(self.buffer) == 0
+            self.buffer += data
+            return was_empty
+
+    def offer(self, data: bytes, waiter: Callable[[], None]) -> Optional[bool]:
+        """
+        Non-blocking `put`: returns None if there is no room for `data`; `waiter()` is then called
+        (from the consumer's thread) once there may be. Otherwise like `put`.
+        """
+        with self.condition:
+            if self.closed:
+                return False
+            if len(self.buffer) + len(data) > self.max_bytes:
+                self.waiters.append(waiter)
+                return None
+            was_empty = len(self.buffer) == 0
+            self.buffer += data
+            return was_empty
+
+    def take(self) -> bytes:
+        """Removes and returns the next frame (may be empty)."""
+        with self.condition:
+            size = min(len(self.buffer), self.frame_bytes)
+            if size < len(self.buffer):
+                size -= size % 2
+            frame = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            self.condition.notify_all()
+            waiters = self._take_waiters() if size else None
+        self._wake(waiters)
+        return frame
+
+    def clear(self) -> None:
+        with self.condition:
+            self.generation += 1
+            self.buffer.clear()
+            self.condition.notify_all()
+            waiters = self._take_waiters()
+        self._wake(waiters)
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.buffer.clear()
+            self.condition.notify_all()
+            waiters = self._take_waiters()
+        self._wake(waiters)
+
+    def _take_waiters(self):
+        waiters, self.waiters = self.waiters, []
+        return waiters
+
+    @staticmethod
+    def _wake(waiters):
+        # outside the lock: a waiter may offer again right away
+        for waiter in waiters or ():
+            waiter()
+
+
+class Connection:
+    """
+    Per-connection state. The text queue is asyncio-native and must only be touched from the
+    event loop thread. Worker threads (e.g. the TTS threads) hand their data over with
+    `loop.call_soon_threadsafe`, which also wakes the sender task. Audio goes through the
+    bounded `AudioBuffer` instead and is encoded (see audio/codecs.py) by the sender task.
+    """
+    def __init__(self, websocket: WebSocket, loop: asyncio.AbstractEventLoop, encoder=None):
+        self.websocket = websocket
+        self.loop = loop
+        self.message_queue: asyncio.Queue = asyncio.Queue()         # text messages
+        self.audio_buffer = AudioBuffer()                           # binary messages (PCM)
+        self.encoder = encoder or PCMEncoder(AUDIO_SAMPLE_RATE)     # only used by the sender task
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+
+    def push_text(self, message: str) -> None:
+        self.message_queue.put_nowait(message)
+        self.wakeup.set()
+
+    def push_bytes(self, data: bytes) -> None:
+        if self.audio_buffer.put(data):
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def offer_bytes(self, data: bytes, waiter: Callable[[], None]) -> bool:
+        was_empty = self.audio_buffer.offer(data, waiter)
+        if was_empty is None:
+            return False
+        if was_empty:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        return True
+
+    def clear_audio(self) -> None:
+        self.audio_buffer.clear()
+        # the codec state belongs to the sender task; the next frame starts a new stream
+        self.loop.call_soon_threadsafe(self.encoder.reset)
+
+
 class WebSocketManager:
     # Class-level dictionary for managing connections
-    connections: Dict[str, WebSocket] = {}
-    message_queues: Dict[str, Queue] = {}          # Thread-safe queue for text messages
-    binary_message_queues: Dict[str, Queue] = {}    # Thread-safe queue for binary messages
+    connections: Dict[str, Connection] = {}
+    # Set in multi-worker deployments (see sessionstore.MessageRouter): messages for connections
+    # held by another worker are forwarded to it.
+    router = None
 
     @staticmethod
-    async def connect(websocket: WebSocket, token: str) -> None:
-        """Accepts a WebSocket connection and stores it under the provided token."""
+    async def connect(websocket: WebSocket, token: str, encoder=None) -> None:
+        """
+        Accepts a WebSocket connection and stores it under the provided token. The client is told
+        the audio format first ("audio.format"); raw PCM at 24 kHz if no encoder is given.
+        """
         await websocket.accept()
-        WebSocketManager.connections[token] = websocket
-        WebSocketManager.message_queues[token] = Queue()  # Initialize text message queue
-        WebSocketManager.binary_message_queues[token] = Queue()  # Initialize binary message queue
+        connection = Connection(websocket, asyncio.get_running_loop(), encoder)
+        WebSocketManager.connections[token] = connection
+        connection.push_text(json.dumps({
+            "function": "audio.format",
+            "codec": connection.encoder.name,
+            "sampleRate": connection.encoder.sample_rate,
+        }))
+        if WebSocketManager.router is not None:
+            WebSocketManager.router.claim(token)
 
     @staticmethod
-    async def remove(token: str) -> None:
-        """Closes and removes a specific WebSocket connection by token."""
-        if token in WebSocketManager.connections:
-            del WebSocketManager.connections[token]
-            del WebSocketManager.message_queues[token]
-            del WebSocketManager.binary_message_queues[token]
+    async def serve(token: str, on_message: Callable[[str], Awaitable[None]]) -> None:
+        """
+        Runs one sender and one receiver task for the connection until one of them ends.
+        Exceptions (e.g. WebSocketDisconnect from the receiver) are re-raised to the caller.
+        """
+        connection = WebSocketManager.connections[token]
+        sender = asyncio.create_task(WebSocketManager._sender(connection))
+        receiver = asyncio.create_task(WebSocketManager._receiver(connection, on_message))
+        connection.tasks = [sender, receiver]
+        try:
+            done, _ = await asyncio.wait(connection.tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in connection.tasks:
+                task.cancel()
+
+    @staticmethod
+    async def remove(token: str, websocket: Optional[WebSocket] = None) -> None:
+        """Removes a specific WebSocket connection by token."""
+        connection = WebSocketManager.connections.get(token)
+        if connection is None:
+            return
+        # The browser may already have reconnected with the same token. Don't drop the new connection.
+        if websocket is not None and connection.websocket is not websocket:
+            return
+        for task in connection.tasks:
+            task.cancel()
+        connection.audio_buffer.close()
+        del WebSocketManager.connections[token]
+        if WebSocketManager.router is not None:
+            WebSocketManager.router.release(token)
 
     @staticmethod
     async def disconnect(token: str) -> None:
         """Closes and removes a specific WebSocket connection by token."""
-        if token in WebSocketManager.connections:
-            websocket = WebSocketManager.connections[token]
-            if websocket.application_state == WebSocketState.CONNECTED:
-                await websocket.close()
-            del WebSocketManager.connections[token]
-            del WebSocketManager.message_queues[token]
-            del WebSocketManager.binary_message_queues[token]
+        connection = WebSocketManager.connections.get(token)
+        if connection is not None:
+            if connection.websocket.application_state == WebSocketState.CONNECTED:
+                await connection.websocket.close()
+            await WebSocketManager.remove(token)
 
 
     @staticmethod
     def send_message(token: str, message: str) -> None:
-        """Adds a text message to the queue to be processed asynchronously."""
-        if token in WebSocketManager.message_queues:
-            WebSocketManager.message_queues[token].put(message)  # Thread-safe enqueue for text
+        """Adds a text message to the queue. Safe to call from any thread."""
+        connection = WebSocketManager.connections.get(token)
+        if connection is not None:
+            connection.loop.call_soon_threadsafe(connection.push_text, message)
+        elif WebSocketManager.router is not None and token:
+            WebSocketManager.router.forward(token, "text", message)
 
 
     @staticmethod
     def send_bytes(token: str, data: bytes) -> None:
-        """Adds a binary message to the binary queue to be processed asynchronously."""
-        if token in WebSocketManager.binary_message_queues:
-            #print("+", end = "")
-            WebSocketManager.binary_message_queues[token].put(data)
-            # allow other thread to read form the queue. IF this sleep is not in, then the 
-            # writer blocks everything. The writer is sometimes too fast and the read has noc chance to get something.
-            time.sleep(0.01)
+        """
+        Adds audio data to the connection's audio buffer. Safe to call from any thread, but
+        blocks (up to WS_AUDIO_BLOCK_TIMEOUT) while the client is behind. Must therefore not be
+        called from the event loop thread.
+        """
+        connection = WebSocketManager.connections.get(token)
+        if connection is not None:
+            connection.push_bytes(data)
+        elif WebSocketManager.router is not None and token:
+            WebSocketManager.router.forward(token, "bytes", data)
 
 
     @staticmethod
-    async def process_queue(token: str) -> None:
-        """Processes and sends all messages in both text and binary queues for the given token."""
-        if token in WebSocketManager.connections:
-            websocket = WebSocketManager.connections[token]
+    def offer_bytes(token: str, data: bytes, waiter: Callable[[], None]) -> bool:
+        """
+        Non-blocking `send_bytes`: returns False if the connection's audio buffer is full, and
+        calls `waiter()` once it has room again. Forwarding to another worker never waits.
+        """
+        connection = WebSocketManager.connections.get(token)
+        if connection is not None:
+            return connection.offer_bytes(data, waiter)
+        if WebSocketManager.router is not None and token:
+            WebSocketManager.router.forward(token, "bytes", data)
+        return True
 
-            # Process text messages
-            message_queue = WebSocketManager.message_queues[token]
-            while True:
+
+    @staticmethod
+    def clear_audio(token: str) -> None:
+        """Drops audio which is queued but not yet sent (e.g. the rest of an interrupted answer)."""
+        connection = WebSocketManager.connections.get(token)
+        if connection is not None:
+            connection.clear_audio()
+        elif WebSocketManager.router is not None and token:
+            WebSocketManager.router.forward(token, "clear", None)
+
+
+    @staticmethod
+    def deliver(token: str, kind: str, payload) -> None:
+        """Entry point for messages forwarded by another worker. Blocking like `send_bytes`."""
+        connection = WebSocketManager.connections.get(token)
+        if connection is None:
+            return
+        if kind == "bytes":
+            connection.push_bytes(bytes(payload))
+        elif kind == "clear":
+            connection.clear_audio()
+        else:
+            connection.loop.call_soon_threadsafe(connection.push_text, payload)
+
+
+    @staticmethod
+    async def _sender(connection: Connection) -> None:
+        """Sleeps until something is queued, then sends text messages first and audio frames afterwards."""
+        websocket = connection.websocket
+        encoder = connection.encoder
+        while True:
+            if encoder.pending():
                 try:
-                    message = message_queue.get_nowait()  # Non-blocking get for text messages
-                    if websocket.application_state == WebSocketState.CONNECTED:
-                        await websocket.send_text(message)
-                except Empty:
-                    break
+                    await asyncio.wait_for(connection.wakeup.wait(), AUDIO_FLUSH_DELAY)
+                except asyncio.TimeoutError:
+                    # no more audio for now: send the samples the codec holds back
+                    tail = encoder.flush()
+                    if tail and websocket.application_state == WebSocketState.CONNECTED:
+                        await websocket.send_bytes(tail)
+                    continue
+            else:
+                await connection.wakeup.wait()
+            connection.wakeup.clear()
+
+            while not connection.message_queue.empty():
+                message = connection.message_queue.get_nowait()
+                if websocket.application_state == WebSocketState.CONNECTED:
+                    await websocket.send_text(message)
 
-            # Process binary messages
-            binary_queue = WebSocketManager.binary_message_queues[token]
             while True:
-                try:
-                    binary_data = binary_queue.get_nowait()  # Non-blocking get for binary messages
-                    await websocket.send_bytes(binary_data)
-                    #print("-", end="")
-                except Empty:
+                if not connection.message_queue.empty():
+                    # control messages (e.g. "speak.stop") must not wait behind audio
+                    connection.wakeup.set()
                     break
+                binary_data = connection.audio_buffer.take()
+                if not binary_data:
+                    break
+                binary_data = encoder.encode(binary_data)
+                if binary_data and websocket.application_state == WebSocketState.CONNECTED:
+                    await websocket.send_bytes(binary_data)
+
+
+    @staticmethod
+    async def _receiver(connection: Connection, on_message: Callable[[str], Awaitable[None]]) -> None:
+        while True:
+            data = await connection.websocket.receive_text()
+            await on_message(data)
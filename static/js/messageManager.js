@@ -30,6 +30,10 @@ class MessageManager {
 
         const wsProtocol = window.location.protocol === "https:" ? "wss://" : "ws://";
         MessageManager.wsUrl = `${wsProtocol}${window.location.host}/websocket/${MessageManager.token}`;
+        if (options.params) {
+            // e.g. the audio codecs the client can decode
+            MessageManager.wsUrl += `?${new URLSearchParams(options.params)}`;
+        }
 
         MessageManager._connectWebSocket();
     }
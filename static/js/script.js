@@ -11,6 +11,7 @@ const micButton = document.getElementById("micButton")
 
 let thinkingIndicator = null;
 let lastReceivedText = ""
+let speculationEnabled = true; // switched off if the server does not support it (SPECULATIVE_CHAT)
 
 async function startGame() {
     try {
@@ -33,6 +34,9 @@ async function startGame() {
             onInterimResult: (text) => {
                 questionInput.value = text;
             },
+            onStableResult: (text) => {
+                speculate(text);
+            },
             onFinalResult: (text) => {
                 questionInput.value = text;
                 sendUserMessage();
@@ -45,7 +49,8 @@ async function startGame() {
         // Initialize the MessageManager
         await MessageManager.initialize({defaultCallback: (message)=>{
             console.log(message)
-        }});
+        }, params: {codecs: TTSManager.supportedCodecs()}});
+        MessageManager.on("audio.format", TTSManager.setFormat);
         MessageManager.on("speak.stop", TTSManager.stop);
         MessageManager.on("binary", TTSManager.enqueue);
         MessageManager.on("tag_event", (message)=>{
@@ -65,9 +70,11 @@ async function startGame() {
 
             // Send "start" message to initialize the game
             showThinkingIndicator();
-            const data = await sendMessage("start");
-            removeThinkingIndicator();
-            addMessage(data.response, "bot");
+            try {
+                await streamMessage("start");
+            } finally {
+                removeThinkingIndicator();
+            }
         }
 
     } catch (error) {
@@ -92,8 +99,7 @@ async function sendUserMessage() {
             addMessage(text, "user");
             showThinkingIndicator();
 
-            const data = await sendMessage(text);
-            addMessage(data.response, "bot");
+            await streamMessage(text);
         } catch (error) {
             addMessage("Error connecting to server.", "bot");
         }
@@ -121,6 +127,84 @@ async function sendMessage(text) {
 }
 
 
+// Lets the server start the answer for a stable interim transcript before the final commit.
+async function speculate(text) {
+    if (!speculationEnabled || !text) return;
+    try {
+        const response = await fetch("/api/chat/speculate", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            credentials: "include",
+            body: JSON.stringify({ text: text })
+        });
+        if (!response.ok) throw new Error(`Server error: ${response.status}`);
+        const data = await response.json();
+        speculationEnabled = data.enabled;
+    } catch (error) {
+        console.error("Error sending interim transcript:", error);
+    }
+}
+
+
+// Sends the text to the streaming chat endpoint and renders the answer while it is generated.
+async function streamMessage(text) {
+    const response = await fetch("/api/chat/stream", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        credentials: "include",
+        body: JSON.stringify({ text: text })
+    });
+    if (!response.ok) throw new Error(`Server error: ${response.status}`);
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let messageBubble = null;
+    let data = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Server-Sent Events are separated by an empty line
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) >= 0) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            const dataLine = rawEvent.split("\n").find(line => line.startsWith("data: "));
+            if (!dataLine) continue;
+            const event = JSON.parse(dataLine.slice(6));
+
+            if (event.type === "delta") {
+                if (!messageBubble) {
+                    removeThinkingIndicator();
+                    messageBubble = addMessage("", "bot");
+                }
+                messageBubble.textContent += event.text;
+            } else if (event.type === "done") {
+                data = event;
+            }
+            // "tag" events are informational; the gestures are synchronized with the audio via the websocket
+        }
+    }
+
+    // a newer message aborted this answer; keep what has been shown so far
+    if (data && data.cancelled) return data;
+
+    if (data && data.response) {
+        if (messageBubble) {
+            messageBubble.textContent = data.response;
+        } else {
+            messageBubble = addMessage(data.response, "bot");
+        }
+        lastReceivedText = data.response;
+    }
+    return data;
+}
+
+
 function showThinkingIndicator() {
     if (!thinkingIndicator) {
         thinkingIndicator = document.createElement("div");
@@ -153,6 +237,7 @@ function addMessage(text, sender) {
     if( sender == "bot"){
         lastReceivedText = text
     }
+    return messageBubble;
 }
 
 
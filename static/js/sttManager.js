@@ -2,9 +2,11 @@
 
 class STTManager {
     static commitIdleTime = 800; // Default to 800ms
+    static stableTime = 250; // Transcript unchanged for this long => onStableResult (before the commit)
     static lang = 'de-DE';
     static onFinalResult = function(text) {};
     static onInterimResult = function(text) {};
+    static onStableResult = function(text) {};
     static onStart = function() {};
     static onEnd = function() {};
     static onError = function(error) {};
@@ -15,6 +17,7 @@ class STTManager {
     static shouldRestart = false;
     static recognition = null;
     static inactivityTimeout = null; // Timer for inactivity
+    static stableTimeout = null; // Timer for a stable interim transcript
 
     static micButton = null; // Will be assigned in initialize
 
@@ -26,7 +29,9 @@ class STTManager {
         STTManager.commitIdleTime = options.commitIdleTime || STTManager.commitIdleTime;
         STTManager.lang = options.lang || STTManager.lang;
         STTManager.onFinalResult = options.onFinalResult || STTManager.onFinalResult;
+        STTManager.stableTime = options.stableTime || STTManager.stableTime;
         STTManager.onInterimResult = options.onInterimResult || STTManager.onInterimResult;
+        STTManager.onStableResult = options.onStableResult || STTManager.onStableResult;
         STTManager.onStart = options.onStart || STTManager.onStart;
         STTManager.onEnd = options.onEnd || STTManager.onEnd;
         STTManager.onError = options.onError || STTManager.onError;
@@ -98,6 +103,7 @@ class STTManager {
 
     static _onResult(event) {
         clearTimeout(STTManager.inactivityTimeout); // Reset inactivity timer
+        clearTimeout(STTManager.stableTimeout);
         let interimTranscript = '';
 
         for (let i = event.resultIndex; i < event.results.length; ++i) {
@@ -116,6 +122,13 @@ class STTManager {
         const combinedTranscript = STTManager.finalTranscript + " " + interimTranscript;
         STTManager.onInterimResult(combinedTranscript.trim());
 
+        // Fires only if the stable time is shorter than the commit idle time
+        if (STTManager.stableTime < STTManager.commitIdleTime) {
+            STTManager.stableTimeout = setTimeout(() => {
+                STTManager.onStableResult(combinedTranscript.trim());
+            }, STTManager.stableTime);
+        }
+
         STTManager.inactivityTimeout = setTimeout(() => {
             if (STTManager.finalTranscript || interimTranscript) {
                 STTManager._finalizeSpeech();
@@ -124,6 +137,7 @@ class STTManager {
     }
 
     static _finalizeSpeech() {
+        clearTimeout(STTManager.stableTimeout);
         const finalText = STTManager.finalTranscript.trim();
         // Reset transcript for the next speech segment
         STTManager.finalTranscript = '';
@@ -1,5 +1,15 @@
 // ttsManager.js
 
+// IMA-ADPCM tables
+const ADPCM_STEPS = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307,
+    337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066,
+    2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899,
+    15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767
+];
+const ADPCM_INDEX = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8];
+
 class TTSManager {
     // Configurable parameters and callbacks
     static playbackRate = 0.92;
@@ -17,6 +27,13 @@ class TTSManager {
     static measurementInProgress = false;
     static measurementValid = false;
 
+    // Audio format of the websocket stream, announced by the server ("audio.format")
+    static codecs = ["adpcm", "ulaw", "alaw", "pcm"];
+    static format = { codec: "pcm", sampleRate: 24000 };
+    static playbackSampleRate = 24000;
+    static opusDecoder = null;
+    static opusTimestamp = 0;
+
     static async initialize(options = {}) {
         // Assign configurable parameters and callbacks
         TTSManager.playbackRate = options.playbackRate || TTSManager.playbackRate;
@@ -28,11 +45,63 @@ class TTSManager {
         if (TTSManager.audioContext === null) {
             TTSManager.audioContext = new (window.AudioContext || window.webkitAudioContext)();
         }
+
+        // Opus needs WebCodecs; the other codecs are decoded below
+        if (await TTSManager._opusSupported() && !TTSManager.codecs.includes("opus")) {
+            TTSManager.codecs.unshift("opus");
+        }
+    }
+
+    // Codecs this client can decode, most preferred first (sent when the websocket connects)
+    static supportedCodecs() {
+        return TTSManager.codecs.join(",");
+    }
+
+    static setFormat(message) {
+        TTSManager.format = { codec: message.codec, sampleRate: message.sampleRate };
+        TTSManager.playbackSampleRate = message.sampleRate;
+        if (TTSManager.opusDecoder) {
+            TTSManager.opusDecoder.close();
+            TTSManager.opusDecoder = null;
+        }
+        if (message.codec === "opus") {
+            TTSManager.opusDecoder = new AudioDecoder({
+                output: (audioData) => {
+                    const samples = new Float32Array(audioData.numberOfFrames);
+                    audioData.copyTo(samples, { planeIndex: 0, format: "f32-planar" });
+                    TTSManager._push(samples, audioData.sampleRate);
+                    audioData.close();
+                },
+                error: (error) => TTSManager.onError(error)
+            });
+            TTSManager._configureOpus();
+        }
+        console.log(`Audio format: ${message.codec}, ${message.sampleRate} Hz`);
     }
 
     static enqueue(arrayBuffer) {
+        switch (TTSManager.format.codec) {
+            case "opus":
+                TTSManager._decodeOpus(arrayBuffer);
+                return;
+            case "adpcm":
+                TTSManager._push(TTSManager._decodeAdpcm(arrayBuffer), TTSManager.format.sampleRate);
+                return;
+            case "ulaw":
+                TTSManager._push(TTSManager._decodeMuLaw(arrayBuffer), TTSManager.format.sampleRate);
+                return;
+            case "alaw":
+                TTSManager._push(TTSManager._decodeALaw(arrayBuffer), TTSManager.format.sampleRate);
+                return;
+            default:
+                TTSManager._push(TTSManager._decodePcm(arrayBuffer), TTSManager.format.sampleRate);
+        }
+    }
+
+    static _push(samples, sampleRate) {
+        TTSManager.playbackSampleRate = sampleRate;
         const wasAccumulatedEmpty = TTSManager.accumulatedChunks.length === 0;
-        TTSManager.accumulatedChunks.push(new Int16Array(arrayBuffer));
+        TTSManager.accumulatedChunks.push(samples);
 
         if (!TTSManager.isPlaying) {
             if (wasAccumulatedEmpty) {
@@ -64,6 +133,99 @@ class TTSManager {
             TTSManager.currentSource.stop();
             TTSManager.currentSource = null;
         }
+
+        // drop frames still being decoded; the server starts a new Opus stream as well
+        if (TTSManager.opusDecoder) {
+            TTSManager.opusDecoder.reset();
+            TTSManager._configureOpus();
+        }
+    }
+
+    static async _opusSupported() {
+        if (typeof AudioDecoder === "undefined") {
+            return false;
+        }
+        try {
+            const support = await AudioDecoder.isConfigSupported({ codec: "opus", sampleRate: 48000, numberOfChannels: 1 });
+            return support.supported;
+        } catch (error) {
+            return false;
+        }
+    }
+
+    static _configureOpus() {
+        TTSManager.opusDecoder.configure({ codec: "opus", sampleRate: TTSManager.format.sampleRate, numberOfChannels: 1 });
+        TTSManager.opusTimestamp = 0;
+    }
+
+    // 20 ms packets, each prefixed with its length (uint16)
+    static _decodeOpus(arrayBuffer) {
+        const view = new DataView(arrayBuffer);
+        let offset = 0;
+        while (offset + 2 <= arrayBuffer.byteLength) {
+            const length = view.getUint16(offset, true);
+            const packet = new Uint8Array(arrayBuffer, offset + 2, length);
+            TTSManager.opusDecoder.decode(new EncodedAudioChunk({ type: "key", timestamp: TTSManager.opusTimestamp, data: packet }));
+            TTSManager.opusTimestamp += 20000; // microseconds
+            offset += 2 + length;
+        }
+    }
+
+    static _decodePcm(arrayBuffer) {
+        const pcm = new Int16Array(arrayBuffer);
+        const samples = new Float32Array(pcm.length);
+        for (let i = 0; i < pcm.length; i++) {
+            samples[i] = pcm[i] / 32768;
+        }
+        return samples;
+    }
+
+    static _decodeMuLaw(arrayBuffer) {
+        const bytes = new Uint8Array(arrayBuffer);
+        const samples = new Float32Array(bytes.length);
+        for (let i = 0; i < bytes.length; i++) {
+            const value = ~bytes[i] & 0xff;
+            const exponent = (value >> 4) & 0x07;
+            const magnitude = ((((value & 0x0f) << 3) + 0x84) << exponent) - 0x84;
+            samples[i] = ((value & 0x80) ? -magnitude : magnitude) / 32768;
+        }
+        return samples;
+    }
+
+    static _decodeALaw(arrayBuffer) {
+        const bytes = new Uint8Array(arrayBuffer);
+        const samples = new Float32Array(bytes.length);
+        for (let i = 0; i < bytes.length; i++) {
+            const value = bytes[i] ^ 0x55;
+            const exponent = (value >> 4) & 0x07;
+            let magnitude = (value & 0x0f) << 4;
+            magnitude = exponent === 0 ? magnitude + 8 : (magnitude + 0x108) << (exponent - 1);
+            samples[i] = ((value & 0x80) ? magnitude : -magnitude) / 32768;
+        }
+        return samples;
+    }
+
+    // Header: int16 predictor, uint8 step index, uint8 padding flag; then two samples per byte, high nibble first
+    static _decodeAdpcm(arrayBuffer) {
+        const view = new DataView(arrayBuffer);
+        let predictor = view.getInt16(0, true);
+        let index = view.getUint8(2);
+        const padded = view.getUint8(3);
+        const bytes = new Uint8Array(arrayBuffer, 4);
+        const samples = new Float32Array(bytes.length * 2 - padded);
+        for (let i = 0; i < samples.length; i++) {
+            const nibble = (i % 2 === 0) ? bytes[i >> 1] >> 4 : bytes[i >> 1] & 0x0f;
+            const step = ADPCM_STEPS[index];
+            let diff = step >> 3;
+            if (nibble & 4) diff += step;
+            if (nibble & 2) diff += step >> 1;
+            if (nibble & 1) diff += step >> 2;
+            predictor += (nibble & 8) ? -diff : diff;
+            predictor = Math.max(-32768, Math.min(32767, predictor));
+            index = Math.max(0, Math.min(88, index + ADPCM_INDEX[nibble]));
+            samples[i] = predictor / 32768;
+        }
+        return samples;
     }
 
     static _playNextInQueue() {
@@ -88,7 +250,7 @@ class TTSManager {
         }
 
         const totalLength = TTSManager.accumulatedChunks.reduce((acc, chunk) => acc + chunk.length, 0);
-        const concatenatedData = new Int16Array(totalLength);
+        const concatenatedData = new Float32Array(totalLength);
         let offset = 0;
         for (const chunk of TTSManager.accumulatedChunks) {
             concatenatedData.set(chunk, offset);
@@ -97,12 +259,8 @@ class TTSManager {
 
         TTSManager.accumulatedChunks = [];
 
-        const sampleRate = 24000;
-        const audioBuffer = TTSManager.audioContext.createBuffer(1, concatenatedData.length, sampleRate);
-        const channelData = audioBuffer.getChannelData(0);
-        for (let i = 0; i < concatenatedData.length; i++) {
-            channelData[i] = concatenatedData[i] / 32768;
-        }
+        const audioBuffer = TTSManager.audioContext.createBuffer(1, concatenatedData.length, TTSManager.playbackSampleRate);
+        audioBuffer.getChannelData(0).set(concatenatedData);
 
         const source = TTSManager.audioContext.createBufferSource();
         source.buffer = audioBuffer;
@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from llm import gemini
+
+
+def test_token_count_cache_is_lru(monkeypatch):
+    monkeypatch.setattr(gemini, "_token_counts", gemini.OrderedDict())
+    monkeypatch.setattr(gemini, "TOKEN_COUNT_CACHE_SIZE", 2)
+    assert gemini._cached_token_count(("m", "a")) is None
+    gemini._remember_token_count(("m", "a"), 1)
+    gemini._remember_token_count(("m", "b"), 2)
+    # a hit makes "a" the most recently used, so "b" is evicted next
+    assert gemini._cached_token_count(("m", "a")) == 1
+    gemini._remember_token_count(("m", "c"), 3)
+    assert gemini._cached_token_count(("m", "b")) is None
+    assert gemini._cached_token_count(("m", "a")) == 1
+    assert gemini._cached_token_count(("m", "c")) == 3
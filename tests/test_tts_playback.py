@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from audio.base_sink import BaseAudioSink
+from tts.base import BaseTTS
+from tts.playback import PlaybackPool
+import tts.base
+
+
+class ListSink(BaseAudioSink):
+    """Takes `room` chunks, then has no room until `drain`."""
+    def __init__(self, room=None):
+        self.chunks = []
+        self.room = room
+        self.waiters = []
+        self.lock = threading.Lock()
+
+    def write(self, session, chunk):
+        self.chunks.append(bytes(chunk))
+
+    def offer(self, session, chunk, wake):
+        with self.lock:
+            if self.room is not None and self.room <= 0:
+                self.waiters.append(wake)
+                return False
+            if self.room is not None:
+                self.room -= 1
+            self.chunks.append(bytes(chunk))
+            return True
+
+    def drain(self, room):
+        with self.lock:
+            self.room = room
+            waiters, self.waiters = self.waiters, []
+        for wake in waiters:
+            wake()
+
+    def close(self, session):
+        pass
+
+
+class FakeTTS(BaseTTS):
+    cacheable = False
+    synthesis_parallelism = 2
+
+    def synthesize(self, text):
+        time.sleep(0.01)
+        for part in text.split():
+            yield part.encode()
+
+
+class Session:
+    ws_token = None
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_many_playbacks_share_few_threads(monkeypatch):
+    pool = PlaybackPool(workers=2)
+    monkeypatch.setattr(tts.base, "playback_pool", pool)
+    finished = []
+    sinks = []
+    feeds = []
+    for number in range(20):
+        sink = ListSink()
+        sinks.append(sink)
+        feeds.append(FakeTTS(sink).speak_stream(Session(), on_finish=lambda number=number: finished.append(number)))
+    # the feeds are still open: the playbacks wait for sentences without holding a thread
+    for sentence in ("a b", "c d", "e"):
+        for feed in feeds:
+            feed.put(sentence)
+        time.sleep(0.02)
+    for feed in feeds:
+        feed.close()
+    assert wait_for(lambda: len(finished) == 20)
+    assert all(sink.chunks == [b"a", b"b", b"c", b"d", b"e"] for sink in sinks)
+    assert pool.stats()["workers"] <= 2
+    assert pool.stats()["playbacks"] == 0
+
+
+def test_stop_ends_a_waiting_playback(monkeypatch):
+    monkeypatch.setattr(tts.base, "playback_pool", PlaybackPool(workers=1))
+    finished = threading.Event()
+    tts_instance = FakeTTS(ListSink())
+    tts_instance.speak_stream(Session(), on_finish=finished.set)
+    tts_instance.stop(Session())
+    assert finished.wait(2)
+
+
+def test_full_sink_wakes_the_playback(monkeypatch):
+    monkeypatch.setattr(tts.base, "playback_pool", PlaybackPool(workers=1))
+    finished = threading.Event()
+    sink = ListSink(room=1)
+    FakeTTS(sink).speak(Session(), "a b c", on_finish=finished.set)
+    assert wait_for(lambda: sink.waiters)
+    assert sink.chunks == [b"a"]
+    sink.drain(room=None)
+    assert finished.wait(2)
+    assert sink.chunks == [b"a", b"b", b"c"]
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from tts.scheduler import TTSScheduler, FIRST_SENTENCE, LATER_SENTENCE
+
+
+def run_jobs(scheduler, jobs, timeout=5):
+    """Submits `jobs` ((backend, owner, limit, priority, seconds)) at once; returns the finish times."""
+    start = time.monotonic()
+    finished = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def job(seconds):
+        def run():
+            time.sleep(seconds)
+            with lock:
+                finished.append(time.monotonic() - start)
+                if len(finished) == len(jobs):
+                    done.set()
+        return run
+
+    for backend, owner, limit, priority, seconds in jobs:
+        scheduler.submit(job(seconds), backend, owner, limit=limit, priority=priority)
+    assert done.wait(timeout)
+    return sorted(finished)
+
+
+def test_burst_runs_concurrently():
+    scheduler = TTSScheduler(workers=8, limits={})
+    finished = run_jobs(scheduler, [("A", 1, None, LATER_SENTENCE, 0.3)] * 3)
+    assert finished[-1] < 0.5
+    assert scheduler.stats()["workers"] == 3
+
+
+def test_backend_limit_bounds_concurrency():
+    scheduler = TTSScheduler(workers=8, limits={})
+    finished = run_jobs(scheduler, [("A", owner, 2, LATER_SENTENCE, 0.2) for owner in range(4)])
+    assert finished[1] < 0.35 and finished[2] >= 0.35
+    assert scheduler.stats()["workers"] == 2
+
+
+def test_first_sentences_go_first():
+    scheduler = TTSScheduler(workers=1, limits={})
+    order = []
+    block = threading.Event()
+    scheduler.submit(block.wait, "A", 0)
+    time.sleep(0.05)
+    for name, priority in (("later", LATER_SENTENCE), ("first", FIRST_SENTENCE)):
+        scheduler.submit(lambda name=name: order.append(name), "A", 1, priority=priority)
+    block.set()
+    deadline = time.monotonic() + 2
+    while len(order) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert order == ["first", "later"]
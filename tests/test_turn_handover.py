@@ -0,0 +1,55 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from sessionstore import MessageRouter, SQLiteSessionStore
+
+
+def test_turn_is_cancelled_on_the_previous_worker(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "sessions.db")
+        first = MessageRouter(SQLiteSessionStore(path), worker_id="first", poll_interval=0.01)
+        second = MessageRouter(SQLiteSessionStore(path), worker_id="second", poll_interval=0.01)
+        turn = asyncio.create_task(asyncio.sleep(10))
+        controls = []
+
+        async def control(session_id, kind):
+            controls.append((session_id, kind))
+            turn.cancel()
+            await asyncio.wait([turn])
+
+        relays = [asyncio.create_task(first.relay(lambda *message: None, control)),
+                  asyncio.create_task(second.relay(lambda *message: None))]
+        try:
+            assert not await first.claim_turn("s1")
+            # the same worker again: nothing to hand over
+            assert not await first.claim_turn("s1")
+            assert await second.claim_turn("s1", timeout=2)
+            assert controls == [("s1", "turn.cancel")]
+            assert turn.cancelled()
+            assert not second.handovers
+
+            second.stop_turn("s1")
+            first.stop_turn("s1")
+            await asyncio.sleep(0.2)
+            # only the worker running the turns gets the barge-in, and only from another worker
+            assert controls == [("s1", "turn.cancel")]
+        finally:
+            for relay in relays:
+                relay.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_claim_gives_up_if_the_previous_worker_is_gone(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "sessions.db")
+        store = SQLiteSessionStore(path)
+        store.claim_turn("s1", "gone")
+        router = MessageRouter(store, worker_id="second", poll_interval=0.01)
+        assert await router.claim_turn("s1", timeout=0.1)
+        assert store.get_turn_owner("s1") == "second"
+
+    asyncio.run(scenario())